@@ -14,6 +14,7 @@ Underlying dimensionality of LVR Data (value is Choice(string)):
 EXAMPLES:
   lvrdb    $edata/P-2018-CRV-2.csv
   lvrdb -s $edata/P-2018-CRV-*.csv 
+  lvrdb -j 4 $edata/P-2018-CRV-*.csv  # one process per file, then merge
 """
 #################
 ## Python library
@@ -27,6 +28,9 @@ import csv
 from collections import defaultdict
 from pprint import pprint, pformat
 import fileinput
+import tempfile
+import shutil
+from concurrent.futures import ProcessPoolExecutor
 #################
 ## External packages
 #   (none)
@@ -179,8 +183,79 @@ class LvrDb():
         self.close_db()
     # END: insert_LVR_from_csv_files()
 
+    def insert_LVR_from_csv_files_parallel(self, csvfile_list, jobs=None):
+        """Ingest each CSV file into its own shard database (one process
+per file, at most JOBS at a time) then merge the shards into this DB.
+Shards are written in a temporary directory next to this DB and removed
+after the merge."""
+        dbdir = os.path.dirname(os.path.abspath(self.dbfile))
+        shard_dir = tempfile.mkdtemp(prefix='lvr-shards-', dir=dbdir)
+        shard_list = [os.path.join(shard_dir, 'shard-{}.db'.format(idx))
+                      for idx in range(len(csvfile_list))]
+        try:
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                list(pool.map(ingest_shard, csvfile_list, shard_list))
+            self.new_db()
+            for sharddb in shard_list:
+                self.merge_shard(sharddb)
+        finally:
+            shutil.rmtree(shard_dir, ignore_errors=True)
+        self.close_db()
+
+    def merge_shard(self, sharddb):
+        """Copy content of SHARDDB (an LVR database made from one CSV
+file) into this DB.  Races are reconciled on header column (as in
+insert_LVR_from_csv_files, all files share the header of the first one)
+and choices on (title, race) so ids are consistent across all shards.
+Votes are bulk copied (in SQL) through a shard-to-merged choice id
+table."""
+        self.conn.commit() # cannot ATTACH within a transaction
+        self.cur.execute('ATTACH DATABASE ? AS shard;', (sharddb,))
+        self.cur.execute('INSERT INTO source SELECT filename FROM shard.source;')
+
+        raceXlat = dict() # lut[shardRaceId] => raceId
+        self.raceColLut.update(dict([(column, rid) for (rid, column)
+                                     in self.cur.execute(sql.race_columns)]))
+        shard_races = self.cur.execute(
+            'SELECT race_id, title, column, num_to_vote_for'
+            ' FROM shard.race ORDER BY race_id;').fetchall()
+        for (shard_rid, title, column, voteFor) in shard_races:
+            if column not in self.raceColLut:
+                self.cur.execute('INSERT INTO race VALUES (?,?,?,?)',
+                                 (None, title, column, voteFor))
+                self.raceColLut[column] = self.cur.lastrowid
+            raceXlat[shard_rid] = self.raceColLut[column]
+
+        choiceXlat = list() # [(shardChoiceId, choiceId), ...]
+        shard_choices = self.cur.execute(
+            'SELECT choice_id, title, race_id, party'
+            ' FROM shard.choice ORDER BY choice_id;').fetchall()
+        for (shard_cid, title, shard_rid, party) in shard_choices:
+            key = (title, raceXlat[shard_rid])
+            if key not in self.choiceInvLut:
+                self.cur.execute('INSERT INTO choice VALUES (?,?,?,?)',
+                                 (None, title, raceXlat[shard_rid], party))
+                self.choiceInvLut[key] = self.cur.lastrowid
+            choiceXlat.append((shard_cid, self.choiceInvLut[key]))
+
+        self.cur.executescript(sql.choice_xlat_schema)
+        self.cur.executemany('INSERT INTO temp.choice_xlat VALUES (?,?)',
+                             choiceXlat)
+        self.cur.execute('INSERT INTO cvr SELECT * FROM shard.cvr;')
+        self.cur.execute(sql.merge_shard_votes)
+        self.conn.commit()
+        self.cur.execute('DROP TABLE temp.choice_xlat;')
+        self.cur.execute('DETACH DATABASE shard;')
+
+
 
 
+def ingest_shard(csvfile, sharddb):
+    """Ingest one CSV file into its own (shard) LVR database. 
+Run in a worker process by insert_LVR_from_csv_files_parallel()."""
+    db = LvrDb(sharddb)
+    db.insert_LVR_from_csv_files([csvfile])
+    return sharddb
         
 
 ##############################################################################
@@ -202,6 +277,10 @@ def main():
                               '  [default="{}"]').format(dfdb))
     parser.add_argument('--summary', '-s', action='store_true',
                         help='Summarize database content.')
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help=('Ingest up to JOBS files at the same time'
+                              ' (one shard DB per file, then merge).'
+                              ' 0 means one per CPU.'))
     parser.add_argument('--loglevel',
                         help='Kind of diagnostic output',
                         choices=['CRTICAL', 'ERROR', 'WARNING',
@@ -218,7 +297,11 @@ def main():
     #!logging.debug('Debug output is enabled in %s !!!', sys.argv[0])
         
     db = LvrDb(args.database)
-    db.insert_LVR_from_csv_files(args.LVRfiles)
+    if (args.jobs != 1) and (len(args.LVRfiles) > 1):
+        db.insert_LVR_from_csv_files_parallel(args.LVRfiles,
+                                              jobs=(args.jobs or None))
+    else:
+        db.insert_LVR_from_csv_files(args.LVRfiles)
         
     if args.summary:
         db.summary()
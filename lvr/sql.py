@@ -42,6 +42,7 @@ CREATE TABLE vote (
 
 
 race_lut = 'SELECT race_id, title, column, num_to_vote_for FROM race;'
+race_columns = 'SELECT race_id, column FROM race;'
 choice_lut = 'SELECT choice_id, title, race_id, party FROM choice;'
 
 #! votecvr = '''
@@ -112,3 +113,21 @@ GROUP BY cvr.precinct, race.column, choice.choice_id;
 
 # All Races, All Candidates, by SELECTED Precinct 
 # SELECT count(vote.cvr_id), cvr.precinct as Precinct, race.title as "rTitle", choice.title as "cTitle" FROM vote,choice,race,cvr WHERE vote.choice_id = choice.choice_id AND choice.race_id = race.race_id AND vote.cvr_id = cvr.cvr_id AND cvr.precinct = 249 GROUP BY race.column, choice.choice_id;
+
+
+##############################################################################
+### Merge of shard databases (one per CSV file)
+###
+
+# lut[shardChoiceId] => choiceId (of merged DB)
+choice_xlat_schema = '''
+CREATE TEMP TABLE choice_xlat (
+   shard_choice_id integer primary key,
+   choice_id integer
+);'''
+
+merge_shard_votes = '''
+INSERT INTO vote
+SELECT shard.vote.cvr_id, temp.choice_xlat.choice_id
+FROM shard.vote, temp.choice_xlat
+WHERE shard.vote.choice_id = temp.choice_xlat.shard_choice_id;'''
@@ -0,0 +1,66 @@
+# EXAMPLE:
+#   python -m unittest lvr/tests/test_lvr_db.py
+import unittest
+import os.path
+import sqlite3
+import tempfile
+
+from lvr.lvr_db import LvrDb
+
+# Two races titled COUNCIL (different columns); COUNCIL is vote for 2
+HEADER = 'Cast Vote Record,Precinct,Ballot Style,MAYOR,COUNCIL,,COUNCIL\n'
+LVR_FILES = [
+    HEADER + '''\
+1,101,BS-1,SMITH,JONES,BROWN,GREEN
+2,101,BS-1,DOE,BROWN,undervote,JONES
+''',
+    HEADER + '''\
+3,102,BS-2,DOE,GREEN,JONES,BROWN
+4,102,BS-2,SMITH,,,
+''',
+    HEADER + '''\
+5,103,BS-1,overvote,JONES,BROWN,JONES
+''',
+    ]
+
+class TestLvrDb(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.csvfiles = list()
+        for (idx,content) in enumerate(LVR_FILES):
+            csvfile = os.path.join(self.tmpdir.name, 'lvr-{}.csv'.format(idx))
+            with open(csvfile, 'w') as f:
+                f.write(content)
+            self.csvfiles.append(csvfile)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def dump(self, dbfile):
+        "RETURN: dict[table] => all rows (ordered)"
+        con = sqlite3.connect(dbfile)
+        tables = dict(
+            race='SELECT * FROM race ORDER BY race_id',
+            choice='SELECT * FROM choice ORDER BY choice_id',
+            cvr='SELECT * FROM cvr ORDER BY cvr_id',
+            vote='SELECT * FROM vote ORDER BY cvr_id, choice_id',
+            source='SELECT count(*) FROM source')
+        content = dict([(table, con.execute(query).fetchall())
+                        for (table,query) in tables.items()])
+        con.close()
+        return content
+
+    def test_parallel_ingest(self):
+        serialdb = os.path.join(self.tmpdir.name, 'serial.db')
+        paralleldb = os.path.join(self.tmpdir.name, 'parallel.db')
+        LvrDb(serialdb).insert_LVR_from_csv_files(self.csvfiles)
+        LvrDb(paralleldb).insert_LVR_from_csv_files_parallel(self.csvfiles,
+                                                             jobs=2)
+        serial = self.dump(serialdb)
+        self.assertEqual(3, len(serial['race']))
+        self.assertEqual(5, len(serial['cvr']))
+        self.assertEqual(serial, self.dump(paralleldb))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+#! /usr/bin/env python
+"""\
+Persistent dictionary of LVR => SOVC title aliases (ALIAS.db).
+
+Aliases are (cleaned) LVR race and choice titles paired with the SOVC
+title they were mapped to in RACEMAP/CHOICEMAP files imported (confirmed)
+for earlier elections.  MapDb.calc looks titles up here before doing any
+fuzzy matching so titles seen before are mapped by exact lookup.
+
+Choice aliases are scoped by the title of the SOVC race the choice is in
+(an alias confirmed in one race is not used in other races).  Each
+imported map is counted once; adding the same confirmed pairs again
+(e.g. re-importing the same maps) does not change the counts.
+
+EXAMPLES:
+  aliasdb --add MAP.db ALIAS.db
+  aliasdb --list ALIAS.db
+"""
+
+import sys
+import argparse
+import logging
+import hashlib
+import sqlite3
+from collections import defaultdict
+
+import vvote.clean as clean
+import vvote.sql as sql
+
+
+class AliasDb():
+    """Manage Alias database (sqlite3 format)."""
+
+    def __init__(self, aliasdb):
+        self.aliasdb = aliasdb
+        self.con = sqlite3.connect(aliasdb)
+        self.upgrade()
+        self.con.executescript(sql.alias_schema)
+
+    def upgrade(self):
+        """Add SCOPE to alias table of ALIAS.db made before it.  Race aliases
+are kept; unscoped choice aliases are dropped (add the maps again)."""
+        columns = [row[1] for row
+                   in self.con.execute('PRAGMA table_info(alias);')]
+        if (len(columns) == 0) or ('scope' in columns):
+            return
+        logging.warning('Dropping unscoped choice aliases of {}'
+                        .format(self.aliasdb))
+        self.con.execute('ALTER TABLE alias RENAME TO alias_unscoped;')
+        self.con.executescript(sql.alias_schema)
+        with self.con:
+            self.con.execute("INSERT INTO alias"
+                             " SELECT kind, '', lvr_title, sovc_title, count"
+                             " FROM alias_unscoped WHERE kind = 'race';")
+            self.con.execute('DROP TABLE alias_unscoped;')
+
+    def close(self):
+        self.con.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def rows(self, kind, triples):
+        """RETURN: sorted alias rows [(kind, scope, lvrTitle, sovcTitle), ...]
+of TRIPLES [(scope, lvrTitle, sovcTitle), ...].  LVR titles are cleaned.
+KIND is 'race' (scope '') or 'choice' (scope is SOVC race title)."""
+        normalize = clean.clean_race if kind == 'race' else clean.clean_choice
+        return sorted(set((kind, scope, normalize(lvr), sovc)
+                          for (scope,lvr,sovc) in triples))
+
+    def add(self, kind, triples):
+        """Count one more confirmation of each (scope, lvrTitle, sovcTitle)
+in TRIPLES (see rows).  RETURN: number of aliases counted"""
+        rows = self.rows(kind, triples)
+        with self.con:
+            self.con.executemany(sql.alias_add, rows)
+        return len(rows)
+
+    def add_maps(self, mapcon, mapdb=None):
+        """Add imported (user confirmed) rows of race_map and choice_map
+from MAP database connection MAPCON.  Same confirmed rows are only
+counted once (by digest) no matter how often they are added.
+RETURN: (numRaces, numChoices) added"""
+        rows = (self.rows('race', mapcon.execute(sql.map_imported_races))
+                + self.rows('choice', mapcon.execute(sql.map_imported_choices)))
+        digest = hashlib.sha256(repr(rows).encode('utf-8')).hexdigest()
+        with self.con:
+            if self.con.execute(sql.alias_source, (digest,)).fetchone():
+                logging.info('Aliases of {} already added'.format(mapdb))
+                return (0, 0)
+            self.con.execute(sql.alias_add_source, (digest, mapdb))
+            self.con.executemany(sql.alias_add, rows)
+        races = len([row for row in rows if row[0] == 'race'])
+        return (races, len(rows) - races)
+
+    def lookup(self, kind, lvr_title, scope=''):
+        """RETURN: SOVC title confirmed for LVR_TITLE (not yet normalized)
+in SCOPE (SOVC race title of choice) or None."""
+        normalize = clean.clean_race if kind == 'race' else clean.clean_choice
+        row = self.con.execute(sql.alias_lookup,
+                               (kind, scope, normalize(lvr_title))).fetchone()
+        return None if row == None else row[0]
+
+    def aliases(self):
+        """RETURN: lut[kind][scope][lvrTitle] => sovcTitle (most confirmed)"""
+        lut = defaultdict(lambda: defaultdict(dict))
+        for (kind, scope, lvr, sovc, count) in self.con.execute(sql.alias_all):
+            lut[kind][scope].setdefault(lvr, sovc)
+        return dict((kind, dict(scopes)) for (kind, scopes) in lut.items())
+
+
+##############################################################################
+
+def main():
+    "Parse command line arguments and do the work."
+    parser = argparse.ArgumentParser(
+        description='Maintain dictionary of confirmed LVR=>SOVC titles',
+        epilog='EXAMPLE: %(prog)s --add MAP.db ALIAS.db'
+        )
+    parser.add_argument('--version', action='version', version='1.0.1')
+    parser.add_argument('aliasdb',
+                        help='ALIAS sqlite DB (created if needed)')
+    parser.add_argument('--add', '-a', metavar='MAPDB',
+                        help='Add imported (confirmed) mappings of MAP DB')
+    parser.add_argument('--list', '-l', action='store_true',
+                        help='Print aliases')
+    parser.add_argument('--loglevel',
+                        help='Kind of diagnostic output',
+                        choices=['CRTICAL', 'ERROR', 'WARNING',
+                                 'INFO', 'DEBUG'],
+                        default='WARNING')
+    args = parser.parse_args()
+
+    log_level = getattr(logging, args.loglevel.upper(), None)
+    if not isinstance(log_level, int):
+        parser.error('Invalid log level: %s' % args.loglevel)
+    logging.basicConfig(level=log_level,
+                        format='%(levelname)s %(message)s',
+                        datefmt='%m-%d %H:%M')
+
+    with AliasDb(args.aliasdb) as adb:
+        if args.add:
+            mapcon = sqlite3.connect(args.add)
+            (races, choices) = adb.add_maps(mapcon, mapdb=args.add)
+            mapcon.close()
+            print('Added {} race and {} choice aliases from {}'
+                  .format(races, choices, args.add))
+        if args.list:
+            for (kind, scope, lvr, sovc, count) in adb.con.execute(
+                    sql.alias_all):
+                print('{}\t{}\t{}\t{}\t{}'.format(kind, scope, lvr, sovc,
+                                                   count))
+
+if __name__ == '__main__':
+    main()
@@ -5,7 +5,8 @@ Transformations to make LVR strings (Race and Choice titles) more like SOVC
 strings.
 """
 
-import copy
+import re
+from functools import lru_cache
 
 def rem_party(name):
     """Remove Party prefix from start of name."""
@@ -28,6 +29,51 @@ replace_strs = [
 ]
 
 
+# remove chars: parens, double-quotes
+nukechars = '()"'
+
+def compile_replacements(pairs):
+    """Compile (old,new) string replacements PAIRS (applied in order) into
+one translate table (leading single character replacements, plus NUKECHARS
+removed) and one regex matching any of the rest.
+RETURN: (table, regex, lut); lut[old] => new (for regex matches)"""
+    table = dict.fromkeys(map(ord, nukechars))
+    multi = list()
+    for (a,b) in pairs:
+        # Single chars can be translated at once only if no earlier
+        # replacement is longer and none outputs a char replaced later.
+        if ((len(a) == 1) and (len(multi) == 0)
+            and not any(c in b for c in map(chr, table))):
+            table[ord(a)] = b
+        else:
+            multi.append((a,b))
+    regex = re.compile('|'.join(re.escape(a) for (a,b) in multi))
+    return table, regex, dict(multi)
+
+choice_table, choice_regex, choice_lut = compile_replacements(replace_strs)
+multi_replace_strs = [(a,b) for (a,b) in replace_strs if a in choice_lut]
+
+@lru_cache(maxsize=1 << 16)
+def clean_choice(title):
+    """Normalize one LVR choice title (party prefix, parens, quotes,
+accents, YES/S...).  Same as applying the steps of clean_choices one at
+a time."""
+    text = rem_party(title).translate(choice_table)
+    new = choice_regex.sub(lambda m: choice_lut[m.group(0)], text)
+    if choice_regex.search(new):
+        # A replacement formed a new match; only in-order replaces agree
+        new = text
+        for (a,b) in multi_replace_strs:
+            new = new.replace(a,b)
+    return new
+
+def clean_race(title):
+    """Normalize one LVR race title."""
+    #
+    # (no change)
+    #
+    return title
+
 # Normalize differentces between LVR and SOVC choices
 # LVR may contain unicode
 def clean_races(lut):
@@ -35,11 +81,8 @@ def clean_races(lut):
 lut[raceId] => newRaceTitle
 RETURN: [(raceId,newRaceTitle), ...];  Sorted by TITLE.
 """
-    newlut = copy.copy(lut) # newlut[cid] => title
-    #
-    # (no change)
-    #
-    return sorted(newlut.items(), key=lambda x: x[1])    
+    return sorted(((k, clean_race(title)) for (k,title) in lut.items()),
+                  key=lambda x: x[1])
 
 # Normalize differentces between LVR and SOVC choices
 # LVR may contain unicode
@@ -48,17 +91,8 @@ def clean_choices(lut):
 lut[choiceId] => newChoiceTitle
 RETURN: [(choiceId,newChoiceTitle), ...];  Sorted by TITLE.
 """
-    newlut = copy.copy(lut) # newlut[cid] => title
-    # remove chars: parens, double-quotes
-    nukechars = str.maketrans(dict.fromkeys('()"'))
     #! ('overvote', 'OVER VOTES'),
     #! ('undervote','UNDER VOTES'),
     #! ('Write-in', 'WRITE-IN'),
-
-    for k in lut.keys():
-        newlut[k] = rem_party(newlut[k])
-        newlut[k] = newlut[k].translate(nukechars)
-        for (a,b) in replace_strs:
-            newlut[k] = newlut[k].replace(a,b)
-    return sorted(newlut.items(), key=lambda x: x[1])
-
+    return sorted(((k, clean_choice(title)) for (k,title) in lut.items()),
+                  key=lambda x: x[1])
@@ -2,9 +2,9 @@
 """Command Line Interpreter for Operational use of vvote software.
 
 Commands:
-  - Convert Excel to CSV (LVR, SOVC)
-  - Ingest LVR from CSV
-  - Ingest SOVC from CSV
+  - Convert Excel to CSV (LVR, SOVC); optional, ingest reads .xlsx directly
+  - Ingest LVR from CSV (or .xlsx)
+  - Ingest SOVC from CSV (or .xlsx)
   - Create MAP (using LVR, SOVC)
   - Export MAPS (to allow editing; RACE, CHOICE)
   - Import MAPS (edited version; RACE, CHOICE)
@@ -12,6 +12,8 @@ Commands:
   - Compare LVR talley to SOVC
 
 Extra commands: (not needed for main flow)
+  - Scan titles only (LVR, SOVC) and create MAP before full ingest
+  - Print query plans of SQL used (flag full scans)
   - Summarize LVR.db
   - Summarize SOVC.db
   - Summarize MAP.db
@@ -27,7 +29,6 @@ import os
 import os.path
 from pathlib import PurePath
 import sqlite3
-import difflib
 import traceback
 
 
@@ -42,10 +43,11 @@ from vvote.sovc_db import SovcDb
 from vvote.mapping_db import MapDb
 #!from vvote.election_db import ElectionDb
 from vvote.lvr_count import lvr_count_and_map
+from vvote.lvr_columns import LvrColumns
 from vvote.xlsx2csv import xlsx2csv
-
-def compare_totals(lvrdb, sovcdb, lvrtotals, sovctotals, diff):
-    pass
+from vvote.explain import explain_queries
+from vvote.title_scan import write_lvr_titles, write_sovc_titles
+from vvote.reconcile import compare_totals, compare_precincts, print_ranking
 
 class VvoteShell(cmd.Cmd):
     intro = '''\
@@ -71,6 +73,10 @@ full_workflow ~/sandbox/vvote/tests/data/day1.lvr.csv ~/sandbox/vvote/tests/data
         self.choicemap = str(self.datadir / 'CHOICEMAP.csv')
         self.htmlfile = str(self.datadir / 'diff.html')
         self.textfile = str(self.datadir / 'diff.txt')
+        self.csvfile = str(self.datadir / 'compare.csv')
+        self.jsonfile = str(self.datadir / 'compare.json')
+        self.precinctfile = str(self.datadir / 'precincts.csv')
+        self.precinctdetailfile = str(self.datadir / 'precinct-diff.csv')
         
         os.makedirs(str(self.datadir), exist_ok=True)
         super(VvoteShell, self).__init__()
@@ -103,7 +109,7 @@ full_workflow ~/sandbox/vvote/tests/data/day1.lvr.csv ~/sandbox/vvote/tests/data
         Convert Excel to CSV file."""
         excel_file,csv_file     = excel_csv.split()
         print('Converting {} to {}'.format(excel_file, csv_file))
-        xlsx2csv(excel_file, csv_file)
+        xlsx2csv(excel_file, csv_file, stream=True)
 
     # lvrdb --database $out/LVR.db --incsv $out/day9.lvr.csv
     #! def do_ingest_lvr(self, lvr_csv):
@@ -175,46 +181,34 @@ full_workflow ~/sandbox/vvote/tests/data/day1.lvr.csv ~/sandbox/vvote/tests/data
 #!            print('{}\t{}\t{}'.format(race,choice,votes))
 #!
 #!
-#!    # ~/sandbox/vvote/scripts/compare.sh
-#!    def do_compare_totals(self, arg):
-#!        """compare_totals 
-#!        Compare total votes from LVR to SOVC."""
-#!        sql_lvr = '''SELECT * FROM summary_totals ORDER BY race,choice;'''
-#!        sql_sovc = '''SELECT 
-#!  race.title as rt, 
-#!  choice.title as ct,
-#!  vote.count as votes
-#!FROM vote, choice, race
-#!WHERE 
-#!  vote.choice_id = choice.choice_id 
-#!  AND choice.race_id = race.race_id
-#!  AND vote.precinct_code = \'ZZZ\'
-#!GROUP BY rt, ct
-#!ORDER BY rt, ct;'''
-#!
-#!        cur = sqlite3.connect(self.lvrdb).cursor()
-#!        cur.execute(sql_lvr)
-#!        fromlines =  [str(tup) for tup in cur.fetchall()]
-#!        
-#!        cur2 = sqlite3.connect(self.sovcdb).cursor()
-#!        cur2.execute(sql_sovc)
-#!        tolines =  [str(tup) for tup in cur2.fetchall()]
-#!
-#!        hd = difflib.HtmlDiff()
-#!        html = hd.make_file(fromlines, tolines, fromdesc='LVR', todesc='SOVR')
-#!        with open(self.htmlfile, mode='w') as f:
-#!            print(html, file=f)
-#!        print('Wrote full differences to HTML at: {}'.format(self.htmlfile))
-#!
-#!        dif = difflib.Differ()
-#!        with open(self.textfile, mode='w') as f:
-#!            for line in dif.compare(fromlines,tolines):
-#!                if line.startswith('  '): continue
-#!                if line.startswith('? '): continue
-#!                if line.endswith(', 0)'): continue
-#!                print(line, file=f)
-#!        print('Wrote delta differences to TEXT at: {}'.format(self.textfile))
 #!
+    # ~/sandbox/vvote/scripts/compare.sh
+    def do_compare_totals(self, arg):
+        """compare_totals 
+        Compare total votes from LVR to SOVC."""
+        counts = compare_totals(self.lvrdb, self.sovcdb,
+                                csvfile=self.csvfile, jsonfile=self.jsonfile,
+                                htmlfile=self.htmlfile,
+                                textfile=self.textfile)
+        print(', '.join('{}: {}'.format(k, v) for k, v in counts.items()))
+        print('Wrote all (race, choice) totals to CSV at: {} and JSON at: {}'
+              .format(self.csvfile, self.jsonfile))
+        print('Wrote mismatches to HTML at: {}'.format(self.htmlfile))
+        print('Wrote mismatches to TEXT at: {}'.format(self.textfile))
+
+    # ~/sandbox/vvote/scripts/compare-precincts.sh
+    def do_compare_precincts(self, arg):
+        """compare_precincts [top]
+        Compare LVR to SOVC votes per precinct (using MAP choice ids).
+        Show TOP (default 10) precincts with most difference."""
+        top = int(arg) if arg.strip() else 10
+        ranking = compare_precincts(self.lvrdb, self.sovcdb, self.mapdb,
+                                    csvfile=self.precinctfile,
+                                    detailfile=self.precinctdetailfile)
+        print_ranking(ranking[:top])
+        print('Wrote precinct ranking to CSV at: {}'.format(self.precinctfile))
+        print('Wrote differing (precinct, choice) votes to CSV at: {}'
+              .format(self.precinctdetailfile))
             
     def do_full_workflow(self, lvr_sovc):
         """full_workflow lvr_csv sovc_csv
@@ -253,6 +247,36 @@ full_workflow ~/sandbox/vvote/tests/data/day1.lvr.csv ~/sandbox/vvote/tests/data
         #!self.do_tally_lvr(dummy)
         #!self.do_compare_totals(dummy)
 
+    def do_scan_titles(self, lvr_sovc):
+        """scan_titles lvr_csv sovc_csv
+        Collect just Race and Choice titles (no votes) and create MAP from
+        them so RACEMAP, CHOICEMAP can be edited during full LVR ingest."""
+        lvr_csv, sovc_csv = [os.path.expanduser(f) for f in lvr_sovc.split()]
+        lvrdb = str(self.datadir / 'LVR-titles.db')
+        sovcdb = str(self.datadir / 'SOVC-titles.db')
+        print('LVR: {} races, {} choices'.format(
+            *write_lvr_titles(lvr_csv, lvrdb, jobs=os.cpu_count())))
+        print('SOVC: {} races, {} choices'.format(
+            *write_sovc_titles(sovc_csv, sovcdb)))
+        with MapDb(self.mapdb, new=True) as mdb:
+            mdb.get_lvr_luts(lvrdb)
+            mdb.get_sovc_luts(sovcdb)
+            mdb.calc()
+            mdb.export(racemap_csv=self.racemap, choicemap_csv=self.choicemap)
+
+    def do_write_columns(self, arg):
+        """write_columns
+        Write columnar sidecar of LVR.db (makes tally and per-precinct
+        counts faster until more ballots are ingested)."""
+        LvrColumns(self.lvrdb).write()
+        print('Wrote columnar sidecar of {}'.format(self.lvrdb))
+
+    def do_explain_queries(self, arg):
+        """explain_queries
+        Print query plan for every query in sql.py; flag full scans."""
+        flagged = explain_queries(self.lvrdb, self.sovcdb, self.mapdb)
+        print('Flagged {} query plan steps'.format(flagged))
+
     def do_quit(self, arg):
         """quit (or EOF)
         Quit vvote Command Line Interpreter"""
@@ -7,3 +7,7 @@ import logging
 class BadSovc(Exception):
     "SOVC excel file did match our expectations"
     pass
+
+class BadMap(Exception):
+    "RACEMAP or CHOICEMAP file has rows that do not match the MAP database"
+    pass
@@ -0,0 +1,144 @@
+#! /usr/bin/env python
+"""\
+Print query plan (EXPLAIN QUERY PLAN) of every query in sql.py.
+
+Flag steps that scan a whole table (no index) or sort with a temporary
+B-tree.  Queries that cannot be prepared against the current databases
+are reported (with the error) instead of a plan.
+
+EXAMPLES:
+  python -m vvote.explain -l LVR.db -s SOVC.db -m MAP.db -a ALIAS.db
+"""
+
+import sys
+import argparse
+import logging
+import re
+import sqlite3
+
+import vvote.sql as sql
+
+attach_re = re.compile(r"^\s*attach\s+'(?P<db>[^']*)'\s+as\s+(?P<name>\w+)\s*;",
+                       re.IGNORECASE | re.MULTILINE)
+query_starts = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+
+
+# Queries whose name does not tell which database they run against
+query_kinds = dict(map_lvr_rc='LVR')
+
+def query_db(name):
+    """RETURN: kind of database (LVR, SOVC, MAP, ALIAS) query NAME runs
+against."""
+    lname = name.lower()
+    if name in query_kinds:
+        return query_kinds[name]
+    if lname.startswith('alias_'):
+        return 'ALIAS'
+    if lname in ('race_map', 'choice_map') or lname.startswith('map_'):
+        return 'MAP'
+    if 'sovc' in lname:
+        return 'SOVC'
+    return 'LVR'
+
+def query_list():
+    """RETURN: [(name, dbKind, attachList, queryText), ...] for every query
+in sql.py.  attachList:: [(dbName, schemaName), ...]"""
+    queries = list()
+    for name,value in sorted(vars(sql).items()):
+        if name.startswith('_') or not isinstance(value, str):
+            continue
+        attach_list = [(m.group('db'), m.group('name'))
+                       for m in attach_re.finditer(value)]
+        text = attach_re.sub('', value).strip()
+        if name == 'map_tpl':
+            text = text.format(src='lvr')
+        if not text.upper().startswith(query_starts):
+            continue
+        queries.append((name, query_db(name), attach_list, text))
+    return queries
+
+def flag_step(detail):
+    """RETURN: warning for one step of a query plan (or empty string)"""
+    if detail.startswith('SCAN ') and (' USING ' not in detail):
+        return 'FULL SCAN'
+    if 'TEMP B-TREE' in detail:
+        return 'TEMP SORT'
+    return ''
+
+def query_plan(dbfiles, kind, attach_list, text):
+    """RETURN: [detail, ...] steps of query plan of TEXT against database
+DBFILES[KIND].  Raise sqlite3.Error if the query cannot be prepared."""
+    # read-only: do not create missing database files
+    con = sqlite3.connect('file:{}?mode=ro'.format(dbfiles[kind]), uri=True)
+    try:
+        for (dbname,schema) in attach_list:
+            # Queries attach MAP.db by name; use the real one.
+            con.execute('ATTACH DATABASE ? AS {};'.format(schema),
+                        ('file:{}?mode=ro'.format(
+                            dbfiles['MAP'] if dbname == 'MAP.db' else dbname),))
+        # plan does not depend on values of (positional) parameters
+        params = (None,) * text.count('?')
+        return [detail for (nid,parent,notused,detail)
+                in con.execute('EXPLAIN QUERY PLAN ' + text, params)]
+    finally:
+        con.close()
+
+def explain_queries(lvrdb, sovcdb, mapdb, aliasdb=None, out=sys.stdout):
+    """Print plan for every query.  RETURN: count of flagged steps"""
+    dbfiles = dict(LVR=lvrdb, SOVC=sovcdb, MAP=mapdb, ALIAS=aliasdb)
+    flagged = 0
+    for (name, kind, attach_list, text) in query_list():
+        print('{} [{}]'.format(name, kind), file=out)
+        if dbfiles[kind] == None:
+            print('   SKIPPED: no {} database'.format(kind), file=out)
+            continue
+        try:
+            plan = query_plan(dbfiles, kind, attach_list, text)
+        except sqlite3.Error as err:
+            print('   ERROR: {} ({})'.format(err, dbfiles[kind]), file=out)
+            continue
+        for detail in plan:
+            flag = flag_step(detail)
+            if flag:
+                flagged += 1
+            print('   {:60} {}'.format(detail, flag).rstrip(), file=out)
+    return flagged
+
+
+##############################################################################
+
+def main():
+    "Parse command line arguments and do the work."
+    parser = argparse.ArgumentParser(
+        description='Print query plans for queries in vvote/sql.py',
+        epilog='EXAMPLE: %(prog)s -l LVR.db -s SOVC.db -m MAP.db'
+        )
+    parser.add_argument('--version', action='version', version='1.0.1')
+    parser.add_argument('--lvrdb', '-l', default='LVR.db',
+                        help='LVR sqlite DB')
+    parser.add_argument('--sovcdb', '-s', default='SOVC.db',
+                        help='SOVC sqlite DB')
+    parser.add_argument('--mapdb', '-m', default='MAP.db',
+                        help='MAP sqlite DB')
+    parser.add_argument('--aliasdb', '-a', default='ALIAS.db',
+                        help='ALIAS sqlite DB')
+    parser.add_argument('--loglevel',
+                        help='Kind of diagnostic output',
+                        choices=['CRTICAL', 'ERROR', 'WARNING',
+                                 'INFO', 'DEBUG'],
+                        default='WARNING')
+    args = parser.parse_args()
+
+    log_level = getattr(logging, args.loglevel.upper(), None)
+    if not isinstance(log_level, int):
+        parser.error('Invalid log level: %s' % args.loglevel)
+    logging.basicConfig(level=log_level,
+                        format='%(levelname)s %(message)s',
+                        datefmt='%m-%d %H:%M')
+
+    flagged = explain_queries(args.lvrdb, args.sovcdb, args.mapdb,
+                               aliasdb=args.aliasdb)
+    print('Flagged {} query plan steps'.format(flagged))
+
+if __name__ == '__main__':
+    main()
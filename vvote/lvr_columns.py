@@ -0,0 +1,261 @@
+#! /usr/bin/env python
+"""\
+Columnar (memory-mapped) copy of the LVR vote data.
+
+An optional sidecar directory next to LVR.db ("LVR.db.columns") holding
+contiguous int32 arrays as flat binary files:
+
+   vote.cvr_id.i32       :: one per vote row
+   vote.choice_id.i32    :: one per vote row (parallel to vote.cvr_id)
+   cvr.cvr_id.i32        :: one per CVR
+   cvr.precinct.i32      :: index into manifest "precincts" (parallel)
+   cvr.ballot_style.i32  :: index into manifest "ballot_styles" (parallel)
+   choice.choice_id.i32  :: one per choice
+   choice.race_id.i32    :: one per choice (parallel)
+   manifest.json         :: labels, row counts, byte order, fingerprint
+                            of LVR.db (see is_current)
+
+The files are memory-mapped on open so tallies are counting passes over
+arrays instead of SQL GROUP BYs over the (row oriented) vote table.
+
+EXAMPLES:
+  python -m vvote.lvr_columns LVR.db
+
+see also: lvr_db.py, lvr_count.py
+"""
+
+import sys
+import argparse
+import logging
+import os
+import os.path
+import shutil
+import sqlite3
+import json
+import mmap
+import operator
+from array import array
+from itertools import repeat
+
+import vvote.sql as sql
+
+# Parallel array files written in one pass over query: [(query, names)]
+# names:: [name, ...]; one per column of query result
+column_files = [
+    (sql.lvr_columns_vote,   ['vote.cvr_id', 'vote.choice_id']),
+    (sql.lvr_columns_choice, ['choice.choice_id', 'choice.race_id']),
+    ]
+itemsize = 4 # int32
+
+
+def bincount(values, minlength=0):
+    """Count occurrences of each non-negative integer in VALUES (as
+numpy.bincount, without numpy: one indexed increment per value).
+RETURN: counts:: list where counts[value] = number of occurrences"""
+    counts = [0] * minlength
+    for value in values:
+        try:
+            counts[value] += 1
+        except IndexError: # first value past end; grow to fit it
+            counts.extend([0] * (value + 1 - len(counts)))
+            counts[value] += 1
+    return counts
+
+
+class LvrColumns():
+    """Manage columnar sidecar of LVR Database."""
+    version = 2
+
+    def __init__(self, dbfile):
+        self.dbfile = dbfile
+        self.coldir = dbfile + '.columns'
+        self.manifest = None
+        self.maps = list()   # [mmap, ...]
+        self.arrays = dict() # arrays[name] => memoryview of int32
+
+    def filename(self, name):
+        return os.path.join(self.coldir, name + '.i32')
+
+    def exists(self):
+        return os.path.exists(os.path.join(self.coldir, 'manifest.json'))
+
+    def remove(self):
+        shutil.rmtree(self.coldir, ignore_errors=True)
+
+    def write(self, batchsize=100000):
+        """(Re)Write sidecar from content of LVR database."""
+        self.remove()
+        os.makedirs(self.coldir)
+        con = sqlite3.connect(self.dbfile)
+        counts = dict() # counts[name] => number of values
+        for query,names in column_files:
+            counts.update(self.write_columns(con, query, names, batchsize))
+
+        # Text columns of CVR are stored as indices into label lists
+        labels = dict(precincts=dict(), ballot_styles=dict())
+        cvr = array('i')
+        precinct = array('i')
+        ballot_style = array('i')
+        for (cvr_id,pc,ball) in con.execute(sql.lvr_columns_cvr):
+            cvr.append(cvr_id)
+            precinct.append(labels['precincts'].setdefault(
+                pc, len(labels['precincts'])))
+            ballot_style.append(labels['ballot_styles'].setdefault(
+                ball, len(labels['ballot_styles'])))
+        for name,arr in [('cvr.cvr_id', cvr),
+                         ('cvr.precinct', precinct),
+                         ('cvr.ballot_style', ballot_style)]:
+            with open(self.filename(name), 'wb') as f:
+                arr.tofile(f)
+            counts[name] = len(arr)
+        fingerprint = self.fingerprint(con)
+        con.close()
+
+        manifest = dict(
+            version=self.version,
+            byteorder=sys.byteorder,
+            counts=counts,
+            fingerprint=fingerprint,
+            precincts=list(labels['precincts']),
+            ballot_styles=list(labels['ballot_styles']),
+            )
+        with open(os.path.join(self.coldir, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f)
+        logging.info('Wrote columnar sidecar: {}'.format(self.coldir))
+
+    def write_columns(self, con, query, names, batchsize):
+        """Write one (parallel) array file per column of QUERY result in
+one pass over its rows.  RETURN: dict[name] => number of values"""
+        cnt = 0
+        cur = con.execute(query)
+        files = [open(self.filename(name), 'wb') for name in names]
+        try:
+            while True:
+                rows = cur.fetchmany(batchsize)
+                if len(rows) == 0:
+                    break
+                for idx,f in enumerate(files):
+                    array('i', [row[idx] for row in rows]).tofile(f)
+                cnt += len(rows)
+        finally:
+            for f in files:
+                f.close()
+        return dict([(name, cnt) for name in names])
+
+    def fingerprint(self, con):
+        """RETURN: [cvrCount, maxCvrId, voteCount, choiceCount, sha256s]
+of LVR database; changes whenever votes are added (sidecar is stale)."""
+        return list(con.execute(sql.lvr_columns_fingerprint).fetchone())
+
+    def is_current(self):
+        """True if sidecar exists and matches the content of LVR database."""
+        if not self.exists():
+            return False
+        with open(os.path.join(self.coldir, 'manifest.json')) as f:
+            manifest = json.load(f)
+        if ((manifest['version'] != self.version)
+            or (manifest['byteorder'] != sys.byteorder)):
+            return False
+        con = sqlite3.connect(self.dbfile)
+        try:
+            fingerprint = self.fingerprint(con)
+        except sqlite3.Error: # LVR.db without sha256 of source
+            return False
+        finally:
+            con.close()
+        return manifest['fingerprint'] == fingerprint
+
+    def open(self):
+        """Memory-map all column files."""
+        with open(os.path.join(self.coldir, 'manifest.json')) as f:
+            self.manifest = json.load(f)
+        if self.manifest['byteorder'] != sys.byteorder:
+            raise Exception('Columnar sidecar ({}) has wrong byte order'
+                            .format(self.coldir))
+        for name in self.manifest['counts']:
+            with open(self.filename(name), 'rb') as f:
+                if self.manifest['counts'][name] == 0:
+                    self.arrays[name] = memoryview(array('i'))
+                    continue
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self.maps.append(mm)
+                self.arrays[name] = memoryview(mm).cast('i')
+        return self
+
+    def close(self):
+        for mv in self.arrays.values():
+            mv.release()
+        self.arrays = dict()
+        for mm in self.maps:
+            mm.close()
+        self.maps = list()
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def choice_race_lut(self):
+        "RETURN: lut[choiceId] => raceId"
+        return dict(zip(self.arrays['choice.choice_id'],
+                        self.arrays['choice.race_id']))
+
+    def total_votes(self):
+        """Count of votes by RaceId, ChoiceId. (see sql.lvr_total_votes)
+RETURN: [(raceId, choiceId, votes), ...]; ordered by choiceId"""
+        counts = bincount(self.arrays['vote.choice_id'])
+        race = self.choice_race_lut()
+        return [(race[cid], cid, votes)
+                for cid,votes in enumerate(counts) if votes > 0]
+
+    def precinct_votes(self):
+        """Count of votes by Precinct, ChoiceId. (see sql.lvr_precinct_votes)
+RETURN: [(precinctCode, choiceId, votes), ...]; ordered by precinct index
+   then choiceId"""
+        precincts = self.manifest['precincts']
+        cvrPrecinct = dict(zip(self.arrays['cvr.cvr_id'],
+                               self.arrays['cvr.precinct']))
+        choices = self.arrays['vote.choice_id']
+        width = (max(choices) + 1) if len(choices) > 0 else 1
+        # key = precinctIndex * width + choiceId; composed with C iterators
+        keys = map(operator.add,
+                   map(operator.mul,
+                       map(cvrPrecinct.__getitem__, self.arrays['vote.cvr_id']),
+                       repeat(width)),
+                   choices)
+        counts = bincount(keys)
+        return [(precincts[key // width], key % width, votes)
+                for key,votes in enumerate(counts) if votes > 0]
+
+
+##############################################################################
+
+def main():
+    "Parse command line arguments and do the work."
+    parser = argparse.ArgumentParser(
+        description='Write columnar (memory-mapped) sidecar of LVR database',
+        epilog='EXAMPLE: %(prog)s LVR.db'
+        )
+    parser.add_argument('--version', action='version', version='1.0.1')
+    parser.add_argument('lvrdb',
+                        help='LVR sqlite DB')
+    parser.add_argument('--loglevel',
+                        help='Kind of diagnostic output',
+                        choices=['CRTICAL', 'ERROR', 'WARNING',
+                                 'INFO', 'DEBUG'],
+                        default='WARNING')
+    args = parser.parse_args()
+
+    log_level = getattr(logging, args.loglevel.upper(), None)
+    if not isinstance(log_level, int):
+        parser.error('Invalid log level: %s' % args.loglevel)
+    logging.basicConfig(level=log_level,
+                        format='%(levelname)s %(message)s',
+                        datefmt='%m-%d %H:%M')
+
+    LvrColumns(args.lvrdb).write()
+    print('Wrote columnar sidecar of {}'.format(args.lvrdb))
+
+if __name__ == '__main__':
+    main()
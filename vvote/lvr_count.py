@@ -13,34 +13,82 @@ import sys
 import argparse
 import logging
 import sqlite3
+import operator
+from array import array
 from pprint import pprint,pformat
 #!from .mapping_db import MapDb
 #!from . import sql
 from vvote.mapping_db import MapDb
+from vvote.lvr_columns import LvrColumns, bincount
 import vvote.sql as sql
-    
-def lvr_count_and_map(lvrdb, mapdb):
-    """Count total votes in LVR (per choice), map to SOVC names."""
+
+def lvr_choice_votes(lvrdb):
+    """Count total votes in LVR (per choice) with one bincount over the
+array of vote choice ids.  Use columnar sidecar if it is current, else
+load the choice ids from LVR.db.
+RETURN: [(raceId, choiceId, votes), ...]; ordered by choiceId"""
+    cols = LvrColumns(lvrdb)
+    if cols.is_current():
+        with cols:
+            return cols.total_votes()
+    con = sqlite3.connect(lvrdb)
+    choices = array('i', map(operator.itemgetter(0),
+                             con.execute(sql.lvr_vote_choice_ids)))
+    race = dict(con.execute(sql.lvr_columns_choice))
+    con.close()
+    return [(race[cid], cid, votes)
+            for cid,votes in enumerate(bincount(choices)) if votes > 0]
+
+def lvr_choice_votes_sql(lvrdb):
+    """Same as lvr_choice_votes() but count with SQL GROUP BY (slow).
+RETURN: [(raceId, choiceId, votes), ...]; ordered by choiceId"""
+    con = sqlite3.connect(lvrdb)
+    totals = [(rid,cid,votes)
+              for (rid,cid,ctitle,votes) in con.execute(sql.lvr_total_votes)]
+    con.close()
+    return totals
+
+def lvr_count_check(lvrdb):
+    """Cross-check array tally against SQL tally.
+RETURN: [(raceId, choiceId, arrayVotes, sqlVotes), ...] for differences"""
+    fast = dict([((rid,cid),votes) for (rid,cid,votes)
+                 in lvr_choice_votes(lvrdb)])
+    slow = dict([((rid,cid),votes) for (rid,cid,votes)
+                 in lvr_choice_votes_sql(lvrdb)])
+    return [(rid, cid, fast.get((rid,cid)), slow.get((rid,cid)))
+            for (rid,cid) in sorted(set(fast) | set(slow))
+            if fast.get((rid,cid)) != slow.get((rid,cid))]
+
+def lvr_count_and_map(lvrdb, mapdb, use_sql=False):
+    """Count total votes in LVR (per choice), map to SOVC names.
+If USE_SQL, count with the (slow) SQL query instead of array tally."""
     mdb = MapDb(mapdb)
     mdb.load_lvr_sovc_luts()
-    cur = sqlite3.connect(mapdb).cursor()
+    cur = mdb.con.cursor()
     raceMap = dict() # raceMap[lvrRaceId] => sovcRaceId
     for (conf,lrid,lti,srid,sti) in cur.execute(sql.race_map):
         raceMap[lrid] = srid
     choiceMap = dict() # choiceMap[lvrChoiceId] => sovcChoiceId
     for (conf,lrid,lcid,lti,scid,sti) in cur.execute(sql.choice_map):
         choiceMap[lcid] = scid
+    mdb.close()
+
+    if use_sql:
+        totals = lvr_choice_votes_sql(lvrdb)
+    else:
+        totals = lvr_choice_votes(lvrdb)
 
+    # sovcTitles[lvrChoiceId] => (sovcRaceTitle, sovcChoiceTitle)
+    sovcTitles = [None] * (max([cid for (rid,cid,votes) in totals],
+                               default=0) + 1)
+    for (rid,cid,votes) in totals:
+        sovcTitles[cid] = (mdb.sovc_rlut[raceMap[rid]],
+                           mdb.sovc_clut[choiceMap[cid]])
     con = sqlite3.connect(lvrdb)
-    cur1 = con.cursor()
-    cur2 = con.cursor()
-    cur1.execute('DELETE FROM summary_totals;')
-    for (rid,cid,ctitle,votes) in cur1.execute(sql.lvr_total_votes):
-        if votes == 0: continue
-        cur2.execute('INSERT INTO summary_totals VALUES (?,?,?)',
-                     (mdb.sovc_rlut[raceMap[rid]],
-                      mdb.sovc_clut[choiceMap[cid]],
-                      votes))
+    con.execute('DELETE FROM summary_totals;')
+    con.executemany('INSERT INTO summary_totals VALUES (?,?,?)',
+                    [sovcTitles[cid] + (votes,)
+                     for (rid,cid,votes) in totals if votes != 0])
     con.commit()
     con.close()
             
@@ -66,6 +114,10 @@ def main():
     parser.add_argument('--totals', '-t', 
                         default=dftot,
                         help='CSV of total votes in LVR (mapped to SOVC names)')
+    parser.add_argument('--sql', action='store_true',
+                        help='Count with SQL GROUP BY instead of array tally')
+    parser.add_argument('--check', action='store_true',
+                        help='Cross-check array tally against SQL tally')
 
     parser.add_argument('--loglevel',
                         help='Kind of diagnostic output',
@@ -82,7 +134,13 @@ def main():
                         datefmt='%m-%d %H:%M')
     logging.debug('Debug output is enabled in %s !!!', sys.argv[0])
 
-    lvr_count_and_map(args.lvrdb, args.mapdb)
+    if args.check:
+        diffs = lvr_count_check(args.lvrdb)
+        print('Array and SQL tallies differ for {} choices'.format(len(diffs)))
+        for (rid,cid,fast,slow) in diffs:
+            print('  race={}, choice={}: array={}, sql={}'
+                  .format(rid, cid, fast, slow))
+    lvr_count_and_map(args.lvrdb, args.mapdb, use_sql=args.sql)
     print('Wrote LVR summary totals into: {}'.format(args.lvrdb))
 
 if __name__ == '__main__':
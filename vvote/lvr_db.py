@@ -18,13 +18,16 @@ import logging
 import os
 import os.path
 import sqlite3
+import time
 from collections import defaultdict
 from pprint import pprint, pformat
 
 #!from . import sql
 #!from .lvr_sheet import LvrSheet
 import vvote.sql
+import vvote.utils as utils
 from vvote.lvr_sheet import LvrSheet
+from vvote.lvr_columns import LvrColumns
 
 
 class LvrDb():
@@ -36,20 +39,52 @@ class LvrDb():
         self.sourcefile = None
         self.conn = None
         self.raceLut = dict() # lut[column] => raceId
+        self.layout = 'rowid' # of vote table; one of sql.lvr_layouts
 
-    def new_db(self, overwrite=True):
+    def new_db(self, overwrite=True, layout=None):
+        """Create DB.  LAYOUT (of vote table) is one of vvote.sql.lvr_layouts;
+'rowid' (default) or 'clustered' (WITHOUT ROWID, keyed by choice)."""
         dbfile = self.dbfile
+        if layout != None:
+            self.layout = layout
         if overwrite:
             if os.path.exists(dbfile):
                 os.remove(dbfile)
                 #print('Removed LVR database: {}'.format(dbfile))
+            LvrColumns(dbfile).remove()
 
         self.conn = sqlite3.connect(dbfile)
         cur = self.conn.cursor()
-        cur.executescript(vvote.sql.lvr_schema)
+        cur.executescript(vvote.sql.lvr_schemas[self.layout])
         #print('Created schema in LVR database: {}'.format(dbfile))
         self.conn.commit()
 
+    def open_db(self):
+        """Open existing DB (to append to it)."""
+        self.conn = sqlite3.connect(self.dbfile)
+        self.layout = self.get_layout(self.conn)
+        self.upgrade_db()
+
+    def upgrade_db(self):
+        "Add SHA256 column to source table of LVR.db made before it"
+        columns = [row[1] for row
+                   in self.conn.execute('PRAGMA table_info(source);')]
+        if 'sha256' not in columns:
+            self.conn.execute('ALTER TABLE source ADD COLUMN sha256 text;')
+            self.conn.commit()
+
+    def get_layout(self, conn):
+        "RETURN: layout of vote table in existing DB"
+        (vote_sql,) = conn.execute(vvote.sql.lvr_vote_layout).fetchone()
+        return 'clustered' if 'WITHOUT ROWID' in vote_sql.upper() else 'rowid'
+
+    def build_indexes(self):
+        """Create secondary indexes (after bulk load so inserts stay fast)."""
+        conn = sqlite3.connect(self.dbfile)
+        conn.executescript(vvote.sql.lvr_index_sets[self.get_layout(conn)])
+        conn.commit()
+        conn.close()
+
     def close_db(self):
         self.conn.commit()
         self.conn.close()
@@ -87,43 +122,111 @@ choiceInvLut :: lut[choiceTitle] => choiceId; MODIFIED IN PLACE
             choice_id = cur.lastrowid
             choiceInvLut[choice_title] = choice_id
         
-    def insert_from_csv(self,csvfile):
-        """Append to existing Sqlite DB."""
-        self.new_db(overwrite=True)
-        sheet = LvrSheet(csvfile)
-        self.sourcfile = sheet.filename
+    def insert_from_csv(self, csvfile, stream=False, bulk=False,
+                        batchsize=50000, columns=False, index=True,
+                        layout='rowid', append=False):
+        """Load CSVFILE into new Sqlite DB (or APPEND to existing one).
+CSVFILE may also be an Excel (.xlsx) file; its rows are read directly.
+If STREAM, ballot rows are read from CSVFILE one at a time instead of
+loading the whole sheet into memory first.
+If BULK, cvr/choice/vote rows are buffered and written BATCHSIZE at a
+time (executemany) in one transaction using ingest-time SQLite
+settings.  Durable settings are restored at commit.  When appending to
+an existing DB the (durable) settings are not changed; a failed append
+must not corrupt ballots ingested before.
+If COLUMNS, also write the columnar sidecar (see lvr_columns.py).
+If INDEX, build secondary indexes after all rows are loaded.
+LAYOUT of vote table is one of vvote.sql.lvr_layouts (ignored on APPEND).
+If APPEND, a file already ingested (same content hash) is skipped and
+CVRs already in DB are not inserted again.  Existing race and choice ids
+are reused.
+RETURN: (ballotCount, elapsedSeconds); ballotCount is of new ballots"""
+        tic = time.time()
+        digest = utils.file_sha256(csvfile)
+        appending = append and os.path.exists(self.dbfile)
+        if appending:
+            self.open_db()
+        else:
+            self.new_db(overwrite=True, layout=layout)
+        fast = bulk and not appending # use non-durable ingest settings
         cur = self.conn.cursor()
-        cells = sheet.cells
+        if digest in [sha for (sha,) in cur.execute(vvote.sql.lvr_source_digests)]:
+            logging.info('Skipping {}; already ingested into {}'
+                         .format(csvfile, self.dbfile))
+            self.close_db()
+            return 0, time.time() - tic
+        sheet = LvrSheet(csvfile, stream=stream)
+        self.sourcfile = sheet.filename
 
         #print('Inserting LVR CSV content into db: {}'.format(self.dbfile))
 
-        choices = defaultdict(set) # of choice_title for each race
-        choiceInvLut = dict() # lut[(raceId,choiceTitle)] => choiceId
+        # lut[(raceId,choiceTitle)] => choiceId
+        choiceInvLut = dict([((rid,title),cid) for (cid,title,rid)
+                             in cur.execute(vvote.sql.lvr_choice)])
+        raceTitleLut = dict([(title,rid) for (rid,title)
+                             in cur.execute(vvote.sql.lvr_race)])
+        knownCvrs = set([str(cvr_id) for (cvr_id,)
+                         in cur.execute(vvote.sql.lvr_cvr_ids)])
         
-        cur.execute('INSERT INTO source VALUES (?)', (csvfile,))
+        if fast:
+            cur.executescript(vvote.sql.lvr_ingest_pragmas)
+        cur.execute('INSERT INTO source VALUES (?,?)', (csvfile, digest))
 
         # INSERT races
         for racename,raceC in sorted(sheet.raceLut.items(),key=lambda x: x[0]):
-            cur.execute('INSERT INTO race VALUES (?,?,?)',
-                        (None, sheet.voteFor[racename], racename))
-            raceId = cur.lastrowid
-            self.raceLut[raceC] = raceId
+            if racename not in raceTitleLut:
+                cur.execute('INSERT INTO race VALUES (?,?,?)',
+                            (None, sheet.voteFor[racename], racename))
+                raceTitleLut[racename] = cur.lastrowid
+            self.raceLut[raceC] = raceTitleLut[racename]
             #!print('DBG: INSERT (race_id, votesAllowed, title) = ({},{},{})'
             #!      .format(rid, sheet.voteFor[racename], racename))
             #@@@ self.insert_fixed_choices(raceId, choiceInvLut)
         # INSERT choices, cvr, vote
-        for r in range(sheet.minDataR, sheet.max_row + 1):
-            cvr_id = cells[r][1]
-            precinct = cells[r][2]
-            ballot = cells[r][3]
+        if bulk:
+            ballots = self.bulk_insert_rows(sheet, choiceInvLut, batchsize,
+                                            skip=knownCvrs)
+        else:
+            ballots = self.insert_rows(sheet, choiceInvLut, skip=knownCvrs)
+        #! print('Added CSV ({}) content to LVR database {}'
+        #!       .format(csvfile, self.dbfile))
+        self.conn.commit()
+        if fast:
+            cur.executescript(vvote.sql.lvr_durable_pragmas)
+        self.close_db()
+        if index:
+            self.build_indexes()
+        if columns:
+            LvrColumns(self.dbfile).write()
+        elapsed = time.time() - tic
+        logging.info('Ingested {} ballots in {:.1f} seconds ({:.0f} ballots/sec)'
+                     .format(ballots, elapsed, ballots / max(elapsed, 1e-6)))
+        return ballots, elapsed
+
+    def insert_rows(self, sheet, choiceInvLut, skip=frozenset()):
+        """INSERT cvr, choice, vote for each ballot row of SHEET.
+choiceInvLut :: lut[(raceId,choiceTitle)] => choiceId; MODIFIED IN PLACE
+skip :: set of CVR ids (as text) that are already in DB
+RETURN: number of ballots"""
+        cur = self.conn.cursor()
+        header = sheet.cells[1]
+        insert_vote = vvote.sql.lvr_insert_vote[self.layout]
+        ballots = 0
+        for r,rowcells in sheet.rows():
+            cvr_id = rowcells[1]
+            precinct = rowcells[2]
+            ballot = rowcells[3]
+            if cvr_id in skip: continue
+            ballots += 1
+            seq = defaultdict(int) # seq[choiceId] => times voted in CVR
 
             cur.execute('INSERT INTO cvr VALUES (?,?,?)',
                         (cvr_id, precinct, ballot))
             #logging.debug('INSERT cvr: {}'.format(cvr_id))
 
             for c in range(sheet.minDataC, sheet.max_col + 1):
-                race_id = self.raceLut[sheet.raceLut[cells[1][c]]]
-                choice_title = cells[r].get(c,None)
+                race_id = self.raceLut[sheet.raceLut[header[c]]]
+                choice_title = rowcells.get(c,None)
                 if choice_title == None: continue
 
                 if (race_id,choice_title) not in choiceInvLut:
@@ -132,13 +235,71 @@ choiceInvLut :: lut[choiceTitle] => choiceId; MODIFIED IN PLACE
                     choice_id = cur.lastrowid
                     choiceInvLut[(race_id,choice_title)] = choice_id
                     
-                cur.execute('INSERT INTO vote VALUES (?,?)',
-                            (cvr_id, choiceInvLut[(race_id,choice_title)]))
-        #! print('Added CSV ({}) content to LVR database {}'
-        #!       .format(csvfile, self.dbfile))
-        self.conn.commit()
-        self.close_db()
+                cur.execute(insert_vote,
+                            self.vote_row(cvr_id,
+                                          choiceInvLut[(race_id,choice_title)],
+                                          race_id, seq))
+        return ballots
+
+    def vote_row(self, cvr_id, choice_id, race_id, seq):
+        """RETURN: row for vote table (in layout of this DB).
+seq :: lut[choiceId] => times already voted in this CVR; MODIFIED IN PLACE"""
+        if self.layout == 'rowid':
+            return (cvr_id, choice_id)
+        seq[choice_id] += 1
+        return (cvr_id, choice_id, race_id, seq[choice_id] - 1)
+
+    def bulk_insert_rows(self, sheet, choiceInvLut, batchsize,
+                         skip=frozenset()):
+        """Same as insert_rows() but buffer rows and INSERT them BATCHSIZE
+at a time.  Choice ids are assigned here (not by sqlite) so votes can
+be buffered before their choice is written.
+RETURN: number of ballots"""
+        cur = self.conn.cursor()
+        header = sheet.cells[1]
+        cur.execute('SELECT coalesce(max(choice_id),0) FROM choice;')
+        (last_choice_id,) = cur.fetchone()
+        # colRace[column] => raceId
+        colRace = dict([(c, self.raceLut[sheet.raceLut[header[c]]])
+                        for c in range(sheet.minDataC, sheet.max_col + 1)])
+        cvr_rows = list()    # [(cvr_id, precinct, ballot), ...]
+        choice_rows = list() # [(choice_id, title, race_id), ...]
+        vote_rows = list()   # [vote_row(), ...]
+        insert_vote = vvote.sql.lvr_insert_vote[self.layout]
+
+        def flush():
+            cur.executemany('INSERT INTO cvr VALUES (?,?,?)', cvr_rows)
+            cur.executemany('INSERT INTO choice VALUES (?,?,?)', choice_rows)
+            if self.layout == 'clustered':
+                # insert in (clustered) key order for B-tree locality
+                vote_rows.sort(key=lambda row: row[1])
+            cur.executemany(insert_vote, vote_rows)
+            cvr_rows.clear()
+            choice_rows.clear()
+            vote_rows.clear()
 
+        ballots = 0
+        for r,rowcells in sheet.rows():
+            cvr_id = rowcells[1]
+            if cvr_id in skip: continue
+            cvr_rows.append((cvr_id, rowcells[2], rowcells[3]))
+            ballots += 1
+            seq = defaultdict(int) # seq[choiceId] => times voted in CVR
+            for c,choice_title in rowcells.items():
+                race_id = colRace.get(c)
+                if race_id == None: continue
+                key = (race_id,choice_title)
+                choice_id = choiceInvLut.get(key)
+                if choice_id == None:
+                    last_choice_id += 1
+                    choice_id = last_choice_id
+                    choiceInvLut[key] = choice_id
+                    choice_rows.append((choice_id, choice_title, race_id))
+                vote_rows.append(self.vote_row(cvr_id, choice_id, race_id, seq))
+            if len(vote_rows) >= batchsize:
+                flush()
+        flush()
+        return ballots
 
 
 ##############################################################################
@@ -153,13 +314,33 @@ def main():
     parser.add_argument('--version', action='version', version='1.0.1')
 
     parser.add_argument('--incsv', type=argparse.FileType('r'),
-                        help='Input CSV file to store into DB')
+                        help='Input CSV (or .xlsx) file to store into DB')
     parser.add_argument('-d', '--database', 
                         default=dfdb,
                         help=('SQlite database file to hold content.'
                               '  [default="{}"]').format(dfdb))
     parser.add_argument('--summary', '-s', action='store_true',
                         help='Summarize database content.')
+    parser.add_argument('--stream', action='store_true',
+                        help=('Read ballots from CSV one row at a time'
+                              ' (constant memory).'))
+    parser.add_argument('--bulk', action='store_true',
+                        help=('Batch INSERTs into one transaction with'
+                              ' ingest-time (non-durable) SQLite settings.'))
+    parser.add_argument('--batchsize', type=int, default=50000,
+                        help='Vote rows per batch INSERT (with --bulk)')
+    parser.add_argument('--layout', choices=vvote.sql.lvr_layouts,
+                        default='rowid',
+                        help=('Layout of vote table: rowid heap or'
+                              ' WITHOUT ROWID clustered by choice'))
+    parser.add_argument('--append', '-a', action='store_true',
+                        help=('Add new ballots to existing database'
+                              ' (skip files and CVRs already ingested)'))
+    parser.add_argument('--no-index', dest='index', action='store_false',
+                        help='Do not build secondary indexes after ingest')
+    parser.add_argument('--columns', action='store_true',
+                        help=('Also write memory-mapped columnar copy of'
+                              ' votes (DATABASE.columns/)'))
     parser.add_argument('--loglevel',
                         help='Kind of diagnostic output',
                         choices=['CRTICAL', 'ERROR', 'WARNING',
@@ -179,7 +360,16 @@ def main():
     if args.incsv:
         args.incsv.close()
         args.incsv = args.incsv.name
-        db.insert_from_csv(args.incsv)
+        (ballots, elapsed) = db.insert_from_csv(args.incsv,
+                                                stream=args.stream,
+                                                bulk=args.bulk,
+                                                batchsize=args.batchsize,
+                                                columns=args.columns,
+                                                index=args.index,
+                                                layout=args.layout,
+                                                append=args.append)
+        print('Ingested {} ballots in {:.1f} seconds ({:.0f} ballots/sec)'
+              .format(ballots, elapsed, ballots / max(elapsed, 1e-6)))
         
     #!db.to_csv(foo)
     #!print('Created CSV from DB in {}'.format(foo))
@@ -33,10 +33,10 @@ FROM race ORDER BY race_id ASC;'''
 
     votecvr_sql = '''
 SELECT cvr.cvr_id as cid, cvr.precinct_code as pc, ballot_style as ball,
-    choice.title as ct, vote.race_id as rid
+    choice.title as ct, choice.race_id as rid
 FROM vote, choice, cvr
 WHERE vote.cvr_id = cvr.cvr_id  AND vote.choice_id = choice.choice_id
-ORDER BY   vote.cvr_id ASC, vote.race_id ASC;'''
+ORDER BY   vote.cvr_id ASC, choice.race_id ASC;'''
     
     conn = sqlite3.connect(dbfile)
     cur = conn.cursor()
@@ -1,10 +1,15 @@
 """\
-Read CSV ballot file (LVR) into object representing a spreadsheet
+Read CSV (or Excel .xlsx) ballot file (LVR) into object representing a spreadsheet
 as cells[row][column]=cellValue plus other bookkeeping instance variables.
+
+In "stream" mode only the header row is kept in cells.  Ballot rows are
+generated one at a time (see LvrSheet.rows) so big files can be ingested
+in constant memory.
 """
 
 from collections import defaultdict
-import csv
+
+from vvote.utils import read_rows
 
 
 class LvrSheet():
@@ -35,29 +40,37 @@ class LvrSheet():
     voteFor = dict() # lut[raceName] = numberToVoteFor; inferred by number
                      # of same race name columns
 
-    def __init__(self, filename):
+    def __init__(self, filename, stream=False):
         """Create: 
 cells[row][col]:: sparse 2D matrix representing sheet
 raceLut[raceName] = columnNumber (left col of race)
 voteFor[raceName] = numberToVoteFor
+
+If STREAM, only the header row is read into cells.  Ballot rows are
+read from the file (one at a time) by rows().
 """
         self.filename = filename
+        self.stream = stream
+        self.cells = defaultdict(dict)
+        self.raceLut = dict()
+        self.voteFor = dict()
         #!choice_id = 0
-        with open(filename, newline='') as csvfile:
-            reader = csv.reader(csvfile, dialect='excel')
-            # rid:: rowId, cid:: columnId
-            for rid,row in enumerate(reader, 1):
-                for cid,val in enumerate(row,1):
-                    value = val.strip()
-                    if len(value) > 0:
-                        self.cells[rid][cid] = value
-                        #!if ((rid >= self.minDataR)  and (cid >= self.minDataC)
-                        #!    and (value not in self.choiceLut)):
-                        #!    self.choiceLut[value] = choice_id
-                        #!    choice_id += 1
-                        self.max_col = max(self.max_col, cid)
-                if (rid >= self.minDataR) and (len(self.cells[rid]) >= self.minDataC):
-                    self.max_row = rid
+        # rid:: rowId, cid:: columnId
+        for rid,row in enumerate(read_rows(filename), 1):
+            self.cells[rid] = self.row_cells(row)
+            #!if ((rid >= self.minDataR)  and (cid >= self.minDataC)
+            #!    and (value not in self.choiceLut)):
+            #!    self.choiceLut[value] = choice_id
+            #!    choice_id += 1
+            if rid == 1:
+                # Header gives the columns (same in STREAM mode); it may
+                # end in blank columns (VoteFor > 1)
+                self.max_col = len(row)
+            if stream:
+                break
+            # Blank ballot (no votes) still has CVR, Precinct, Ballot Style
+            if (rid >= self.minDataR) and (len(self.cells[rid]) > 0):
+                self.max_row = rid
         # Fill RaceName for VoteFor > 1
         raceName = None
         for c in range(self.minDataC, self.max_col + 1):
@@ -70,6 +83,34 @@ voteFor[raceName] = numberToVoteFor
                 self.voteFor[raceName] += 1
         # END: init
 
+    @staticmethod
+    def row_cells(row):
+        """RETURN: dict[columnId] => value; for non-blank values of ROW"""
+        cells = dict()
+        for cid,val in enumerate(row,1):
+            value = val.strip()
+            if len(value) > 0:
+                cells[cid] = value
+        return cells
+
+    def rows(self):
+        """Generate (rowId, dict[columnId] => value) for each non-empty
+ballot row (including blank ballots; rows without votes).
+If sheet was created with STREAM, rows are read (one at a time) from
+file so memory use does not depend on size of file."""
+        if not self.stream:
+            for rid in range(self.minDataR, self.max_row + 1):
+                if len(self.cells[rid]) > 0:
+                    yield rid, self.cells[rid]
+            return
+        for rid,row in enumerate(read_rows(self.filename), 1):
+            if rid < self.minDataR:
+                continue
+            cells = self.row_cells(row)
+            if len(cells) > 0:
+                self.max_row = rid
+                yield rid, cells
+
     def summary(self):
         print('''
 Sheet Summary:
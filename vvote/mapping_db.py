@@ -14,10 +14,12 @@ import logging
 import os
 import os.path
 import sqlite3
-from itertools import product
 import traceback
 
 from difflib import SequenceMatcher
+from functools import lru_cache
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from pprint import pprint,pformat
 import csv
 from collections import defaultdict
@@ -26,6 +28,9 @@ from collections import defaultdict
 #!from . import sql
 import vvote.clean as clean
 import vvote.sql as sql
+from vvote.utils import file_fingerprint
+from vvote.alias_db import AliasDb
+from vvote.exceptions import BadMap
 
 ##############################################################################
 ### Database
@@ -40,10 +45,30 @@ Race and Choice titles from LVR strings to SOVC strings."""
         ('undervote','UNDER VOTES'),
         ('Write-in', 'WRITE-IN')
         ]
+    # Title pairs less similar than this are left unmapped
+    min_similarity = 0.0
+    # Only score candidate pairs (from n-gram index) when more pairs than this
+    prune_above = 2500
+    max_candidates = 8 # per title
+    # Number of processes mapping choices of races (1 == no process pool)
+    jobs = 1
+    # Change when layout of LUT snapshot tables changes
+    snapshot_version = 1
+    # Titles confirmed in earlier elections (see alias_db.py)
+    aliasdb = None
     
-    def __init__(self, mapdb, new=False):
+    def __init__(self, mapdb, new=False, min_similarity=None, jobs=None,
+                 aliasdb=None):
+        """MAPDB=None gives a MapDb without database (title matching only)."""
         self.mapdb = mapdb
-        self.con = sqlite3.connect(self.mapdb)
+        if min_similarity != None:
+            self.min_similarity = min_similarity
+        if jobs != None:
+            self.jobs = jobs
+        if aliasdb != None:
+            self.aliasdb = aliasdb
+        self.aliases = dict() # aliases[kind][scope][lvrTitle] => sovcTitle
+        self.con = None if mapdb == None else sqlite3.connect(self.mapdb)
         # LVR db data
         self.lvr_rlut = dict() # lut[raceId] => raceTitle
         self.lvr_clut = dict() # lut[choiceId] => choiceTitle
@@ -52,52 +77,146 @@ Race and Choice titles from LVR strings to SOVC strings."""
         self.sovc_rlut = dict() # lut[raceId] => raceTitle
         self.sovc_clut = dict() # lut[choiceId] => choiceTitle
         self.sovc_rclut = defaultdict(list) # lut[raceId] => [choiceId, ...]
+        # scores[(lvrTitle,sovcTitle)] => similarity; persisted in MAP.db
+        self.scores = dict()
+        self.new_scores = list() # [(lvrTitle,sovcTitle,ratio), ...] unsaved
         if new:
             #print('Creating new map db: {}'.format(mapdb))
             if os.path.exists(mapdb):
+                # Similarity scores outlive the map they were computed for
+                self.load_similarity()
+                self.con.close()
                 os.remove(mapdb)
                 #print('Removed existing MAP database: {}'.format(mapdb))
                 self.con = sqlite3.connect(mapdb)
             self.con.executescript(sql.map_schema)
-            self.con.execute('INSERT INTO source VALUES(?,?,?,?)',
-                             (1,mapdb,None,None))
-            self.con.commit()
+            with self.con:
+                self.con.execute('INSERT INTO source VALUES(?,?,?,?)',
+                                 (1,mapdb,None,None))
+                self.new_scores = [key + (ratio,)
+                                   for (key,ratio) in self.scores.items()]
+                self.save_similarity()
+
+    def close(self):
+        "Close connection to MAP database (uncommitted changes are lost)"
+        if self.con != None:
             self.con.close()
+            self.con = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
 
     def get_lvr_luts(self, lvrdb):
         """Extract 3 LUTS from DB that contain choices per race and 
     map choice and race ids to corresponding titles."""
-        self.con = sqlite3.connect(self.mapdb)
-        self.con.execute("UPDATE source SET lvr_filename = ? WHERE sid=1",
-                         (lvrdb,))
+        self.lvr_rlut.clear()
+        self.lvr_clut.clear()
+        self.lvr_rclut.clear()
         con = sqlite3.connect(lvrdb)
         for (rid,rti,cid,cti) in con.execute(sql.lvr_choices):
             self.lvr_rlut[rid] = rti
             self.lvr_clut[cid] = cti
             self.lvr_rclut[rid].append(cid)
+        con.close()
         
-        self.con.execute('DELETE from lvr_race;')
-        for id,t in self.lvr_rlut.items():
-            self.con.execute('INSERT INTO lvr_race VALUES (?,?)',(id, t))
-        self.con.execute('DELETE from lvr_choice;')
-        for id,t in self.lvr_clut.items():
-            self.con.execute('INSERT INTO lvr_choice VALUES (?,?)',(id, t))
-
-        self.con.commit()
+        with self.con:
+            self.con.execute("UPDATE source SET lvr_filename = ? WHERE sid=1",
+                             (lvrdb,))
+            self.save_snapshot('lvr', lvrdb)
 
     def get_sovc_luts(self, sovcdb):
         """Extract 3 LUTS from DB that contain choices per race and 
     map choice and race ids to corresponding titles."""
-        self.con = sqlite3.connect(self.mapdb)
-        self.con.execute("UPDATE source SET sovc_filename = ? WHERE sid=1",
-                         (sovcdb,))
+        self.sovc_rlut.clear()
+        self.sovc_clut.clear()
+        self.sovc_rclut.clear()
         con = sqlite3.connect(sovcdb)
         for (rid,rti,cid,cti) in con.execute(sql.sovc_choices):
             self.sovc_rlut[rid] = rti
             self.sovc_clut[cid] = cti
             self.sovc_rclut[rid].append(cid)
-        self.con.commit()
+        con.close()
+        with self.con:
+            self.con.execute("UPDATE source SET sovc_filename = ? WHERE sid=1",
+                             (sovcdb,))
+            self.save_snapshot('sovc', sovcdb)
+
+    def save_snapshot(self, src, dbfile):
+        """Copy LUTs of SRC ('lvr' or 'sovc') into MAP.db tables
+{src}_race, {src}_choice, {src}_rc with fingerprint of DBFILE."""
+        rlut = getattr(self, src + '_rlut')
+        clut = getattr(self, src + '_clut')
+        rclut = getattr(self, src + '_rclut')
+        self.con.execute(sql.map_snapshot_schema)
+        for table in ('race', 'choice', 'rc'):
+            self.con.execute('DELETE FROM {}_{};'.format(src, table))
+        self.con.executemany('INSERT INTO {}_race VALUES (?,?)'.format(src),
+                             rlut.items())
+        self.con.executemany('INSERT INTO {}_choice VALUES (?,?)'.format(src),
+                             clut.items())
+        self.con.executemany('INSERT INTO {}_rc VALUES (?,?)'.format(src),
+                             [(rid,cid) for (rid,cids) in rclut.items()
+                              for cid in cids])
+        self.con.execute('INSERT OR REPLACE INTO snapshot VALUES (?,?,?,?)',
+                         (src, dbfile, file_fingerprint(dbfile),
+                          self.snapshot_version))
+
+    def load_snapshot(self, src, dbfile):
+        """Load LUTs of SRC ('lvr' or 'sovc') from MAP.db snapshot.
+RETURN: False (nothing loaded) if snapshot is missing or was not taken
+from the current content of DBFILE."""
+        self.con.execute(sql.map_snapshot_schema)
+        row = self.con.execute(sql.map_snapshot, (src,)).fetchone()
+        if row == None:
+            return False
+        (filename, fingerprint, version) = row
+        if (filename != dbfile) or (version != self.snapshot_version):
+            return False
+        current = file_fingerprint(dbfile)
+        if current == None:
+            logging.warning('Using LUT snapshot in {} of missing DB {}'
+                            .format(self.mapdb, dbfile))
+        elif current != fingerprint:
+            return False
+        rlut = getattr(self, src + '_rlut')
+        clut = getattr(self, src + '_clut')
+        rclut = getattr(self, src + '_rclut')
+        rlut.clear()
+        clut.clear()
+        rclut.clear()
+        for (rid,rti,cid,cti) in self.con.execute(sql.map_tpl.format(src=src)):
+            rlut[rid] = rti
+            clut[cid] = cti
+            rclut[rid].append(cid)
+        return True
     
+    def load_similarity(self):
+        """Read similarity scores saved in MAP.db by earlier calculations."""
+        self.con.execute(sql.map_similarity_schema)
+        self.scores = dict(((lvr,sovc),ratio) for (lvr,sovc,ratio)
+                           in self.con.execute(sql.map_similarity))
+        self.new_scores = list()
+
+    def save_similarity(self):
+        "Store similarity scores computed since last load/save."
+        self.con.executemany(sql.map_insert_similarity, self.new_scores)
+        self.new_scores = list()
+
+    def similar(self, lvr, sovc):
+        "Similarity of titles; computed once per pair (see load_similarity)"
+        if (lvr == None) or (sovc == None):
+            return 0
+        key = (lvr,sovc)
+        ratio = self.scores.get(key)
+        if ratio == None:
+            ratio = similar(lvr, sovc)
+            self.scores[key] = ratio
+            self.new_scores.append((lvr, sovc, ratio))
+        return ratio
+
     def text_cidmap(self, cidmap):
         """idmap:: [(conf, lvr_id, sovc_id,), ...]"""
         return pformat([(conf, self.lvr_clut.get(lid), self.sovc_clut.get(sid))
@@ -119,29 +238,109 @@ Race and Choice titles from LVR strings to SOVC strings."""
         cur = self.con.cursor()
         cur.execute('SELECT lvr_filename,sovc_filename FROM source;')
         self.lvrdb,self.sovcdb = cur.fetchone()
-        self.get_lvr_luts(self.lvrdb)
-        self.get_sovc_luts(self.sovcdb)
+        # Read (slower) source DBs only if they changed since snapshot
+        if not self.load_snapshot('lvr', self.lvrdb):
+            self.get_lvr_luts(self.lvrdb)
+        if not self.load_snapshot('sovc', self.sovcdb):
+            self.get_sovc_luts(self.sovcdb)
         
-    def calc(self):
+    def upgrade_maps(self):
+        "Add ORIGIN column to race_map, choice_map of MAP.db made before it"
+        for table in ('race_map', 'choice_map'):
+            columns = [row[1] for row
+                       in self.con.execute('PRAGMA table_info({});'
+                                           .format(table))]
+            if 'origin' not in columns:
+                self.con.execute("ALTER TABLE {} ADD COLUMN origin text"
+                                 " DEFAULT 'calc';".format(table))
+
+    def reusable_maps(self):
+        """Find rows of current race_map and choice_map that still agree
+with the (current) LVR and SOVC LUTs: same ids and titles on both sides.
+  RETURN: (races, choices)
+    races :: dict[lvrRaceId] => (conf, lvrRaceId, sovcRaceId, origin)
+    choices :: dict[lvrRaceId] => [(conf, lvrChoiceId, sovcChoiceId, origin),
+                                   ...]"""
+        races = dict()
+        for (conf,lid,lti,sid,sti,origin) in self.con.execute(
+                sql.map_race_rows):
+            if ((lid != None) and (sid != None)
+                and (self.lvr_rlut.get(lid) == lti)
+                and (self.sovc_rlut.get(sid) == sti)):
+                races[lid] = (conf, lid, sid, origin)
+        choices = defaultdict(list)
+        for (conf,lrid,lid,lti,sid,sti,origin) in self.con.execute(
+                sql.map_choice_rows):
+            if ((lrid not in races) or (lid == None) or (sid == None)
+                or (self.lvr_clut.get(lid) != lti)
+                or (self.sovc_clut.get(sid) != sti)
+                or (lid not in self.lvr_rclut[lrid])
+                or (sid not in self.sovc_rclut[races[lrid][2]])):
+                continue
+            choices[lrid].append((conf, lid, sid, origin))
+        return races, choices
+
+    def confirmed(self, conf, origin):
+        "True if mapping must not be changed by (incremental) calc"
+        return (conf == 1.0) or (origin != 'calc')
+
+    def keep_rows(self, rows, lvr_ids, sovc_ids):
+        """Split ROWS [(conf, lvrId, sovcId, origin), ...] of an existing map
+into those to keep and those to recalculate.  Unconfirmed rows are
+recalculated when there is anything new (not in ROWS) to pair them with.
+  RETURN: [(conf, lvrId, sovcId, origin), ...] rows to keep"""
+        new_lvr = set(lvr_ids) - set(lid for (c,lid,sid,o) in rows)
+        new_sovc = set(sovc_ids) - set(sid for (c,lid,sid,o) in rows)
+        if (len(new_lvr) > 0) and (len(new_sovc) > 0):
+            return [row for row in rows if self.confirmed(row[0], row[3])]
+        return rows
+
+    def calc(self, incremental=False):
+        """Calculate race and choice maps.  If INCREMENTAL, keep existing
+mappings that still agree with the LVR,SOVC titles and only calculate
+the ones for new or changed titles (and unconfirmed ones that could pair
+with them)."""
         print('(re)Calculating mapping from map data')
 
         self.load_lvr_sovc_luts()
-        self.con = sqlite3.connect(self.mapdb)
+        self.load_similarity()
+        self.upgrade_maps()
+        if self.aliasdb != None:
+            with AliasDb(self.aliasdb) as adb:
+                self.aliases = adb.aliases()
+        if incremental:
+            oldraces,oldchoices = self.reusable_maps()
+        else:
+            oldraces,oldchoices = dict(), defaultdict(list)
         
-        self.con.execute('DELETE from race_map;')
-        self.con.execute('DELETE from choice_map;')
-
         ### Compare Races of LVR,SOVC
+        keep = self.keep_rows(list(oldraces.values()),
+                              self.lvr_rlut, self.sovc_rlut)
+        keep_lvr = set(lid for (c,lid,sid,o) in keep)
+        keep_sovc = set(sid for (c,lid,sid,o) in keep)
         # ridmap:: [(conf, lvr_id, sovc_id,), ...]
-        ridmap = self.gen_map_by_matchblocks(clean.clean_races(self.lvr_rlut),
-                                             self.sovc_rlut.items() )
+        ridmap = self.gen_map_by_matchblocks(
+            [(id,title) for (id,title) in clean.clean_races(self.lvr_rlut)
+             if id not in keep_lvr],
+            [(id,title) for (id,title) in self.sovc_rlut.items()
+             if id not in keep_sovc],
+            aliases=self.aliases.get('race', dict()).get('') )
+        # origins[(lvr_id, sovc_id)] => origin of kept map row
+        raceOrigins = dict(((lid,sid),o) for (c,lid,sid,o) in keep)
+        ridmap = set(ridmap) | set((c,lid,sid) for (c,lid,sid,o) in keep)
+        logging.info('Kept {} race mappings; calculated {}'
+                     .format(len(keep), len(ridmap) - len(keep)))
         #! print('ridmap(conf,lvrid,sovcid)=',ridmap)
         lvrmaplist = [lvrid for (c,lvrid,sovcid) in ridmap]
         ridmapLut = dict([(lvrid,sovcid) for (c,lvrid,sovcid) in ridmap])
-        self.insert_race_map(ridmap)
 
         ### Compare Choices of LVR,SOVC (choices for each race independent)
         missing = 0
+        # racejobs:: [(lvrRaceId, sovcRaceId, lvr_lut, sovc_lut, aliases), ...]
+        racejobs = list()
+        choiceAliases = self.aliases.get('choice', dict())
+        # keptChoices[lvrRaceId] => [(conf, lvrId, sovcId, origin), ...]
+        keptChoices = dict()
         for lvrRaceId,choiceIds in self.lvr_rclut.items():
             if lvrRaceId not in lvrmaplist:
                 logging.warning('There is no mapping of LVR race "{}" to SOVC'
@@ -151,63 +350,109 @@ Race and Choice titles from LVR strings to SOVC strings."""
             sovcRaceId = ridmapLut[lvrRaceId]
             #!self.print_lvr_race_choices(lvrRaceId)
             #!self.print_sovc_race_choices(sovcRaceId)
-            lvr_lut = dict([(cid, self.lvr_clut[cid]) for cid in choiceIds])
+            if oldraces.get(lvrRaceId, (0,0,None))[2] == sovcRaceId:
+                kept = self.keep_rows(oldchoices[lvrRaceId], choiceIds,
+                                      self.sovc_rclut[sovcRaceId])
+                keptChoices[lvrRaceId] = kept
+                kept_lvr = set(lid for (c,lid,sid,o) in kept)
+                kept_sovc = set(sid for (c,lid,sid,o) in kept)
+                if ((kept_lvr >= set(choiceIds))
+                    and (kept_sovc >= set(self.sovc_rclut[sovcRaceId]))):
+                    continue # no change to choices of race
+            else:
+                kept_lvr = kept_sovc = set()
+            lvr_lut = dict([(cid, self.lvr_clut[cid]) for cid in choiceIds
+                            if cid not in kept_lvr])
             # use just generated ridmap to map LVR_RaceId to SOVC_RaceId
             sovc_lut = dict([(cid, self.sovc_clut[cid])
-                             for cid in self.sovc_rclut[sovcRaceId]])
-            # cidmap:: [(conf, lvr_id, sovc_id), ...]
-            cidmap = self.gen_map_by_matchblocks(clean.clean_choices(lvr_lut),
-                                                 sovc_lut.items(),
-                                                 lvr_raceid=lvrRaceId,
-                                                 sovc_raceid=sovcRaceId )
+                             for cid in self.sovc_rclut[sovcRaceId]
+                             if cid not in kept_sovc])
+            # no aliases for LVR race without SOVC match (sovcRaceId None)
+            aliases = choiceAliases.get(self.sovc_rlut.get(sovcRaceId))
+            racejobs.append((lvrRaceId, sovcRaceId, lvr_lut, sovc_lut,
+                             aliases))
+
+        if (self.jobs > 1) and (len(racejobs) > 1):
+            settings = dict(min_similarity=self.min_similarity,
+                            prune_above=self.prune_above,
+                            max_candidates=self.max_candidates)
+            with ProcessPoolExecutor(max_workers=self.jobs,
+                                     initializer=init_choice_worker,
+                                     initargs=(settings, self.scores)) as pool:
+                results = list(pool.map(
+                    map_race_choices, racejobs,
+                    chunksize=max(1, len(racejobs) // (4 * self.jobs))))
+        else:
+            results = [map_race_choices(job, self) for job in racejobs]
+
+        choicerows = list()
+        for (lvrRaceId, sovcRaceId, cidmap, scores) in results:
             #print('DBG cidmap=',pformat(cidmap))
-            self.insert_choice_map(cidmap,lvrRaceId, sovcRaceId)
             #!print('Choices map for race "{}":\n{}'
             #!      .format(self.lvr_rlut[lvrRaceId],
             #!               self.text_cidmap(cidmap)))
-
-        self.con.commit()
-        self.con.close()
-
-
-    def insert_race_map(self,raceIdMap):
-        for (conf, lvr_id, sovc_id) in raceIdMap:
-            lvr_title = self.lvr_rlut.get(lvr_id, '<none>')
-            sovc_title = self.sovc_rlut[sovc_id] if sovc_id else '<none>'
-            self.con.execute('INSERT INTO race_map VALUES (?,?,?,?,?)',
-                             (conf, lvr_id, lvr_title, sovc_id, sovc_title))
+            for (lvr,sovc,ratio) in scores:
+                if (lvr,sovc) not in self.scores:
+                    self.scores[(lvr,sovc)] = ratio
+                    self.new_scores.append((lvr,sovc,ratio))
+            kept = keptChoices.pop(lvrRaceId, [])
+            kept_lvr = set(lid for (c,lid,sid,o) in kept)
+            kept_sovc = set(sid for (c,lid,sid,o) in kept)
+            # fixed mapping may pair choices that were kept
+            cidmap = [(c,lid,sid) for (c,lid,sid) in cidmap
+                      if (lid not in kept_lvr) and (sid not in kept_sovc)]
+            choicerows.extend(self.choice_map_rows(cidmap, lvrRaceId))
+            choicerows.extend(self.choice_map_rows(kept, lvrRaceId))
+        for (lvrRaceId, kept) in keptChoices.items(): # races with no changes
+            choicerows.extend(self.choice_map_rows(kept, lvrRaceId))
+
+        logging.info('Computed {} new similarity scores (reused {})'
+                     .format(len(self.new_scores),
+                             len(self.scores) - len(self.new_scores)))
+        with self.con: # replace maps in one transaction
+            self.con.execute('DELETE from race_map;')
+            self.con.execute('DELETE from choice_map;')
+            self.insert_race_map(ridmap, raceOrigins)
+            self.con.executemany(
+                'INSERT INTO choice_map VALUES (?,?,?,?,?,?,?)', choicerows)
+            self.save_similarity()
+
+
+    def insert_race_map(self, raceIdMap, origins=dict()):
+        """raceIdMap :: [(conf, lvr_id, sovc_id), ...]
+origins[(lvr_id, sovc_id)] => origin (default 'calc')"""
+        self.con.executemany(
+            'INSERT INTO race_map VALUES (?,?,?,?,?,?)',
+            [(conf,
+              lvr_id, self.lvr_rlut.get(lvr_id, '<none>'),
+              sovc_id, self.sovc_rlut[sovc_id] if sovc_id else '<none>',
+              origins.get((lvr_id, sovc_id), 'calc'))
+             for (conf, lvr_id, sovc_id) in raceIdMap])
+
+    def choice_map_rows(self, choiceIdMap, lvrRaceId):
+        """RETURN: choice_map table rows for choices of one LVR race
+  choiceIdMap :: [(conf, lvr_id, sovc_id[, origin]), ...]"""
+        return [(row[0],
+                 lvrRaceId,
+                 row[1], self.lvr_clut.get(row[1], None),
+                 row[2], self.sovc_clut.get(row[2], None),
+                 row[3] if len(row) > 3 else 'calc')
+                for row in choiceIdMap]
 
     def insert_choice_map(self,choiceIdMap, lvrRaceId, sovcRaceId):
-        for (conf, lvr_id, sovc_id) in choiceIdMap:
-            self.con.execute('INSERT INTO choice_map VALUES (?,?,?,?,?,?)',
-                             (conf,
-                              lvrRaceId, 
-                              lvr_id,  self.lvr_clut.get(lvr_id, None),
-                              sovc_id, self.sovc_clut.get(sovc_id, None)
-                             ))
+        self.con.executemany('INSERT INTO choice_map VALUES (?,?,?,?,?,?,?)',
+                             self.choice_map_rows(choiceIdMap, lvrRaceId))
 
 
         
-    def gen_map_by_matchblocks(self, cleaned_lvr_items, sovc_items,
-                               lvr_raceid=None,
-                               sovc_raceid=None ):
-        """Generate LVR=>SOVC title mapping. 
-For CHOICE map (if lvr_raceid provided), ignore fixed_mapping choices. They 
-will be added later.
-  lvr_items :: [(id,title), ...]
-  RETURN:  idmap:: set([(conf, lvr_id, sovc_id), ...])"""
+    def pair_titles(self, lvr_items, sovc_items):
+        """Pair LVR titles with SOVC titles.  Identical titles first (as
+matching blocks of the title lists), then the rest by maximum total
+similarity.
+  lvr_items, sovc_items :: [(id,title), ...]  (neither empty)
+  RETURN: set([(conf, lvr_id, sovc_id), ...])"""
         idmap = set()
-        #!print('DBG: init idmap=',pformat(idmap))
-        fixed_lvr,fixed_sovc = zip(*self.fixed_mapping)
-        lvr_items = [(id,title) for (id,title) in cleaned_lvr_items
-                     if (title not in fixed_lvr)]
-        sovc_items = [(id,title) for (id,title) in sovc_items
-                      if (title not in fixed_sovc)]
-        if len(lvr_items) == 0:
-            return [(0,None,sid) for sid,stitle in sovc_items]
         iid,ititle = zip(*lvr_items)
-        if len(sovc_items) == 0:
-            return [(0,lid,None) for lid in iid]
         jid,jtitle = zip(*sovc_items)
         s = SequenceMatcher(None, ititle, jtitle)
         lvr_unmapped = set(iid)
@@ -219,26 +464,77 @@ will be added later.
                 lvr_unmapped.discard(lvr_id)
                 sovc_unmapped.discard(sovc_id)
                 idmap.add((1.0, lvr_id, sovc_id))
-        lvr_lut = dict(cleaned_lvr_items)
+        lvr_lut = dict(lvr_items)
         sovc_lut = dict(sovc_items)
-        bestlvr = None
-        bestsovc = None
-        while (len(lvr_unmapped) != 0) and (len(sovc_unmapped) != 0):
-            bestconf = -1
-            for lvr_id,sovc_id in product(lvr_unmapped,sovc_unmapped):
-                conf = similar(lvr_lut[lvr_id], sovc_lut[sovc_id])
-                if conf > bestconf:
-                    bestconf = conf
-                    bestlvr = lvr_id
-                    bestsovc = sovc_id
-            lvr_unmapped.discard(bestlvr)
-            sovc_unmapped.discard(bestsovc)
-            idmap.add((bestconf, bestlvr, bestsovc))
-        # If any LVR ids were not paired up, map them to NONE
-        for lvr_id in lvr_unmapped:
-            idmap.add((0, lvr_id, None))
-        for sovc_id in sovc_unmapped:
-            idmap.add((0, None, sovc_id))
+        # Pair up the rest by maximum total similarity (scored once per pair)
+        lvr_ids = sorted(lvr_unmapped)
+        sovc_ids = sorted(sovc_unmapped)
+        if len(lvr_ids) * len(sovc_ids) > self.prune_above:
+            # Unlikely pairs (few shared n-grams) are not scored (weight 0)
+            simmat = [[0.0] * len(sovc_ids) for lvr_id in lvr_ids]
+            for (i,j) in candidate_pairs([lvr_lut[id] for id in lvr_ids],
+                                         [sovc_lut[id] for id in sovc_ids],
+                                         self.max_candidates):
+                simmat[i][j] = self.similar(lvr_lut[lvr_ids[i]],
+                                            sovc_lut[sovc_ids[j]])
+        else:
+            simmat = [[self.similar(lvr_lut[lvr_id], sovc_lut[sovc_id])
+                       for sovc_id in sovc_ids]
+                      for lvr_id in lvr_ids]
+        for (i,j) in optimal_assignment(simmat):
+            if simmat[i][j] == 0.0: # maybe never scored
+                simmat[i][j] = self.similar(lvr_lut[lvr_ids[i]],
+                                            sovc_lut[sovc_ids[j]])
+            if simmat[i][j] < self.min_similarity:
+                continue
+            idmap.add((simmat[i][j], lvr_ids[i], sovc_ids[j]))
+        return idmap
+
+    def gen_map_by_matchblocks(self, cleaned_lvr_items, sovc_items,
+                               lvr_raceid=None,
+                               sovc_raceid=None,
+                               aliases=None ):
+        """Generate LVR=>SOVC title mapping. 
+For CHOICE map (if lvr_raceid provided), ignore fixed_mapping choices. They 
+will be added later.
+  lvr_items :: [(id,title), ...]
+  aliases :: dict[lvrTitle] => sovcTitle; confirmed in earlier elections
+     (for choices, only the ones confirmed in this SOVC race)
+  RETURN:  idmap:: set([(conf, lvr_id, sovc_id), ...])"""
+        idmap = set()
+        #!print('DBG: init idmap=',pformat(idmap))
+        fixed_lvr,fixed_sovc = zip(*self.fixed_mapping)
+        lvr_items = [(id,title) for (id,title) in cleaned_lvr_items
+                     if (title not in fixed_lvr)]
+        sovc_items = [(id,title) for (id,title) in sovc_items
+                      if (title not in fixed_sovc)]
+        # Exact lookup of titles confirmed in earlier elections
+        if aliases:
+            sovc_inv = dict() # sovc_inv[title] => id (first with title)
+            for (id,title) in sovc_items:
+                sovc_inv.setdefault(title, id)
+            unaliased = list()
+            for (id,title) in lvr_items:
+                sovc_id = sovc_inv.pop(aliases.get(title), None)
+                if sovc_id == None:
+                    unaliased.append((id,title))
+                else:
+                    idmap.add((1.0, id, sovc_id))
+            aliased = set(sovc_id for (conf,lvr_id,sovc_id) in idmap)
+            lvr_items = unaliased
+            sovc_items = [(id,title) for (id,title) in sovc_items
+                          if id not in aliased]
+        if (len(lvr_items) > 0) and (len(sovc_items) > 0):
+            idmap.update(self.pair_titles(lvr_items, sovc_items))
+        # If any ids were not paired up, map them to NONE
+        lvr_paired = set(lvr_id for (conf,lvr_id,sovc_id) in idmap)
+        sovc_paired = set(sovc_id for (conf,lvr_id,sovc_id) in idmap)
+        for (lvr_id,title) in lvr_items:
+            if lvr_id not in lvr_paired:
+                idmap.add((0, lvr_id, None))
+        for (sovc_id,title) in sovc_items:
+            if sovc_id not in sovc_paired:
+                idmap.add((0, None, sovc_id))
 
         #### Add fixed_map for choices (WRITE-IN, etc.)
         if lvr_raceid != None:  
@@ -257,7 +553,7 @@ will be added later.
         
     
     def export(self, racemap_csv='RACEMAP.csv', choicemap_csv='CHOICEMAP.csv' ):
-        con = sqlite3.connect(self.mapdb)
+        con = self.con
         headers = 'Conf,LId,LTitle,SId,STitle'.split(',')
         with open(racemap_csv, 'w', newline='') as csvfile:
             writer = csv.writer(csvfile, dialect='excel')
@@ -392,13 +688,14 @@ will be added later.
                         row['Conf'], row['SId'], row['STitle'])
         if errors == 0:
             self.con.execute('DELETE from race_map;')
-            for ((lid,ltitle), (conf,sid,stitle)) in new.items():
-                self.con.execute('INSERT INTO race_map VALUES(?,?,?,?,?)',
-                                 (conf, lid, ltitle, sid, stitle))
-            print('RACEMAP imported from: {}'.format(racemap_csv))
+            self.con.executemany('INSERT INTO race_map VALUES(?,?,?,?,?,?)',
+                                 [(conf, lid, ltitle, sid, stitle, 'import')
+                                  for ((lid,ltitle), (conf,sid,stitle))
+                                  in new.items()])
         else:
             logging.error('NOT importing RACEMAP due to {} errors.'
                           .format(errors))
+        return errors == 0
 
 
         
@@ -427,28 +724,166 @@ will be added later.
 
         if errors == 0:
             self.con.execute('DELETE from choice_map;')
-            for ((race,lid,ltitle), (conf,sid,stitle)) in new.items():
-                self.con.execute('INSERT INTO choice_map VALUES(?,?,?,?,?,?)',
-                                 (conf, race, lid, ltitle, sid, stitle))
-            print('CHOICEMAP imported from: {}'.format(choicemap_csv))
+            self.con.executemany(
+                'INSERT INTO choice_map VALUES(?,?,?,?,?,?,?)',
+                [(conf, race, lid, ltitle, sid, stitle, 'import')
+                 for ((race,lid,ltitle), (conf,sid,stitle)) in new.items()])
         else:
             logging.error('NOT importing CHOICEMAP due to {} errors.'
                           .format(errors))
+        return errors == 0
                     
     def load_maps(self, racemap_csv, choicemap_csv):
-        self.con = sqlite3.connect(self.mapdb)
+        """Import (edited) RACEMAP and CHOICEMAP files.  Both maps are
+imported or (if either has invalid rows) neither; raise BadMap."""
         self.load_lvr_sovc_luts()
-        self.load_race_map(racemap_csv=racemap_csv)
-        self.load_choice_map(choicemap_csv=choicemap_csv)
-        self.con.commit()
-
-
+        self.upgrade_maps()
+        with self.con: # import both maps in one transaction
+            races = self.load_race_map(racemap_csv=racemap_csv)
+            choices = self.load_choice_map(choicemap_csv=choicemap_csv)
+            if not (races and choices):
+                raise BadMap('Did not import maps; invalid rows in {}'
+                             .format(' and '.join(
+                                 [f for (f,ok) in [(racemap_csv, races),
+                                                   (choicemap_csv, choices)]
+                                  if not ok])))
+        print('RACEMAP imported from: {}'.format(racemap_csv))
+        print('CHOICEMAP imported from: {}'.format(choicemap_csv))
+        if self.aliasdb != None:
+            # Remember confirmed titles for mapping of later elections
+            with AliasDb(self.aliasdb) as adb:
+                adb.add_maps(self.con, mapdb=self.mapdb)
+
+
+@lru_cache(maxsize=1 << 16)
 def similar(lvr,sovc):
     "Symetric similarity [0,1].  1.0 for identical."
     if (lvr == None) or (sovc == None):
         return 0
     return SequenceMatcher(a=lvr, b=sovc).ratio()
 
+# Title matcher of a process in the choice mapping pool (see MapDb.calc)
+_worker_mdb = None
+
+def init_choice_worker(settings, scores):
+    "Initialize process of pool: matcher with SETTINGS and known SCORES"
+    global _worker_mdb
+    _worker_mdb = MapDb(None)
+    for (name,value) in settings.items():
+        setattr(_worker_mdb, name, value)
+    _worker_mdb.scores = dict(scores)
+
+def map_race_choices(job, mdb=None):
+    """Map choice titles of one race.  Runs in a pool process (MDB=None)
+or in the calling process with MDB.
+  job :: (lvrRaceId, sovcRaceId, lvr_lut, sovc_lut, aliases)
+    lut[choiceId] => title; aliases[lvrTitle] => sovcTitle (or None)
+  RETURN: (lvrRaceId, sovcRaceId, cidmap, newScores)
+    cidmap :: set([(conf, lvr_id, sovc_id), ...])
+    newScores :: [(lvrTitle, sovcTitle, ratio), ...] (empty if MDB given)"""
+    (lvrRaceId, sovcRaceId, lvr_lut, sovc_lut, aliases) = job
+    if mdb == None:
+        mdb = _worker_mdb
+        # just enough LUTs for the fixed mapping of this race
+        mdb.lvr_clut = lvr_lut
+        mdb.lvr_rclut = {lvrRaceId: list(lvr_lut)}
+        mdb.sovc_clut = sovc_lut
+        mdb.sovc_rclut = {sovcRaceId: list(sovc_lut)}
+        mdb.new_scores = list()
+    cidmap = mdb.gen_map_by_matchblocks(clean.clean_choices(lvr_lut),
+                                        sovc_lut.items(),
+                                        lvr_raceid=lvrRaceId,
+                                        sovc_raceid=sovcRaceId,
+                                        aliases=aliases )
+    newScores = list() if mdb is not _worker_mdb else mdb.new_scores
+    return (lvrRaceId, sovcRaceId, cidmap, newScores)
+
+def title_grams(title, n=3):
+    """RETURN: set of character N-grams and words of (lower cased) TITLE"""
+    text = ' {} '.format(title.lower())
+    grams = set(text[i:i+n] for i in range(len(text)-n+1))
+    grams.update(text.split())
+    return grams
+
+def candidate_pairs(lvr_titles, sovc_titles, limit=8):
+    """Use an inverted index of n-grams over SOVC_TITLES to find likely
+matches without comparing every pair of titles.  Each title (on either
+side) gets the LIMIT titles of the other side sharing the most n-grams.
+  RETURN: set([(lvrIndex, sovcIndex), ...])"""
+    index = defaultdict(list) # index[gram] => [sovcIndex, ...]
+    for (j,title) in enumerate(sovc_titles):
+        for gram in title_grams(title):
+            index[gram].append(j)
+    pairs = set()
+    best_lvr = defaultdict(list) # best_lvr[sovcIndex] => [(shared,i), ...]
+    for (i,title) in enumerate(lvr_titles):
+        shared = Counter()
+        for gram in title_grams(title):
+            shared.update(index.get(gram, ()))
+        for (j,count) in shared.most_common(limit):
+            pairs.add((i,j))
+        for (j,count) in shared.items():
+            best_lvr[j].append((count,i))
+    for (j,counts) in best_lvr.items():
+        counts.sort(reverse=True)
+        pairs.update((i,j) for (count,i) in counts[:limit])
+    return pairs
+
+def optimal_assignment(weights):
+    """Assign rows to columns for maximum total weight (Hungarian algorithm,
+O(n^2 m) for n <= m).
+  weights :: [[weight, ...], ...]; n rows of m columns
+  RETURN: [(row, column), ...]; one pair for each of min(n,m) rows/columns"""
+    n = len(weights)
+    m = len(weights[0]) if n > 0 else 0
+    if (n == 0) or (m == 0):
+        return []
+    if n > m:
+        return [(i,j) for (j,i)
+                in optimal_assignment([list(col) for col in zip(*weights)])]
+    inf = float('inf')
+    # Minimize cost (= -weight).  Arrays are 1-based; index 0 is a sentinel.
+    u = [0.0] * (n+1)  # row potentials
+    v = [0.0] * (m+1)  # column potentials
+    p = [0] * (m+1)    # p[column] => row assigned to column
+    way = [0] * (m+1)  # way[column] => previous column on augmenting path
+    for i in range(1, n+1):
+        p[0] = i
+        j0 = 0
+        minv = [inf] * (m+1)
+        used = [False] * (m+1)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            row = weights[i0-1]
+            delta = inf
+            j1 = 0
+            for j in range(1, m+1):
+                if not used[j]:
+                    cur = -row[j-1] - u[i0] - v[j]
+                    if cur < minv[j]:
+                        minv[j] = cur
+                        way[j] = j0
+                    if minv[j] < delta:
+                        delta = minv[j]
+                        j1 = j
+            for j in range(m+1):
+                if used[j]:
+                    u[p[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while True: # augment along path
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+            if j0 == 0:
+                break
+    return [(p[j]-1, j-1) for j in range(1, m+1) if p[j] != 0]
+
 
           
 
@@ -476,6 +911,19 @@ def main():
                         help='Create NEW map DB')
     parser.add_argument('--calc', '-c', action='store_true',
                         help='Calculating mapping (and store in db)')
+    parser.add_argument('--update', '-u', action='store_true',
+                        help=('With --calc, only recalculate mappings of'
+                              ' new or changed titles (keep confirmed ones)'))
+    parser.add_argument('--aliasdb', '-a',
+                        help=('ALIAS sqlite DB of titles confirmed in earlier'
+                              ' elections; used by --calc, added to by'
+                              ' --importmaps'))
+    parser.add_argument('--minconf', type=float, default=0.0,
+                        help=('Leave titles unmapped when best similarity'
+                              ' is below this [0.0:1.0]'))
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help=('Number of processes to map choices of races'
+                              ' (default: %(default)s)'))
     parser.add_argument('--pretty', '-p', action='store_true',
                         help='Pretty-print mapping')
     parser.add_argument('--exportmaps', '-e', action='store_true',
@@ -507,7 +955,8 @@ def main():
     logging.debug('Debug output is enabled in %s !!!', sys.argv[0])
 
 
-    mdb = MapDb(args.mapdb, new=args.new)
+    mdb = MapDb(args.mapdb, new=args.new, min_similarity=args.minconf,
+                jobs=args.jobs, aliasdb=args.aliasdb)
     
     if args.lvrdb:
         mdb.get_lvr_luts(args.lvrdb)
@@ -515,11 +964,12 @@ def main():
         mdb.get_sovc_luts(args.sovcdb)
 
     if args.calc:
-        mdb.calc()
+        mdb.calc(incremental=args.update)
     if args.exportmaps:
         mdb.export()
     if args.importmaps:
         mdb.load_maps(*args.importmaps)
+    mdb.close()
         
 if __name__ == '__main__':
     main()
@@ -0,0 +1,323 @@
+#! /usr/bin/env python
+"""\
+Reconcile vote totals from LVR (summary_totals) against SOVC county totals.
+
+Both sides are keyed by (race, choice) title.  The SOVC side is loaded
+into a dict and the LVR rows are joined against it in one linear pass
+(hash join), so no sorting or line diffing is needed and a single title
+that sorts differently cannot shift the rest of the comparison.
+
+Every key gets one row with a status:
+  match      both sides have the same votes (missing counts as 0)
+  mismatch   both sides have the key but votes differ
+  lvr_only   key only in LVR (with non-zero votes)
+  sovc_only  key only in SOVC (with non-zero votes)
+
+Per precinct (compare_precincts) the join is on integer ids instead of
+titles: LVR choice ids are mapped to SOVC choice ids with choice_map of
+MAP.db, both sides are laid out as flat (precinct x choice) arrays and
+diffed in one pass; precincts are ranked by total absolute difference.
+
+EXAMPLES:
+  python -m vvote.reconcile -l LVR.db -s SOVC.db --csv compare.csv
+  python -m vvote.reconcile -l LVR.db -s SOVC.db -m MAP.db \\
+       --precincts precincts.csv
+"""
+
+import argparse
+import logging
+import csv
+import json
+import html
+import sqlite3
+import operator
+from array import array
+from collections import Counter
+
+import vvote.sql as sql
+from vvote.lvr_columns import LvrColumns
+
+fieldnames = ['status', 'race', 'choice', 'lvr_votes', 'sovc_votes', 'delta']
+statuses = ['match', 'mismatch', 'lvr_only', 'sovc_only']
+# SOVC choices not compared per precinct (same as scripts/compare-precincts.sh)
+skip_choices = {'OVER VOTES', 'UNDER VOTES', 'WRITE-IN'}
+precinct_fieldnames = ['rank', 'precinct', 'lvr_votes', 'sovc_votes',
+                       'abs_delta', 'choices_differ']
+
+
+def lvr_totals(lvrdb):
+    "Generate (race, choice, votes) from summary_totals of LVRDB."
+    con = sqlite3.connect(lvrdb)
+    try:
+        yield from con.execute(sql.lvr_summary_totals)
+    finally:
+        con.close()
+
+def sovc_totals(sovcdb):
+    "RETURN: dict[(race, choice)] => votes for county totals of SOVCDB."
+    con = sqlite3.connect(sovcdb)
+    try:
+        return {(race, choice): votes
+                for (race, choice, votes)
+                in con.execute(sql.sovc_county_totals)}
+    finally:
+        con.close()
+
+def reconcile(lvr_rows, sovc_lut):
+    """Join LVR_ROWS [(race, choice, votes), ...] with
+SOVC_LUT dict[(race, choice)] => votes.
+RETURN: [dict(status, race, choice, lvr_votes, sovc_votes, delta), ...]
+LVR keys in LVR order followed by SOVC-only keys in SOVC order.
+Votes missing from one side are None; delta is lvr_votes - sovc_votes
+(missing counts as 0)."""
+    remaining = dict(sovc_lut)  # keys not yet joined
+    rows = list()
+    for (race, choice, lvr_votes) in lvr_rows:
+        sovc_votes = remaining.pop((race, choice), None)
+        rows.append(reconcile_row(race, choice, lvr_votes, sovc_votes))
+    for ((race, choice), sovc_votes) in remaining.items():
+        rows.append(reconcile_row(race, choice, None, sovc_votes))
+    return rows
+
+def reconcile_row(race, choice, lvr_votes, sovc_votes):
+    "RETURN: one reconcile row (dict)"
+    delta = (lvr_votes or 0) - (sovc_votes or 0)
+    if delta == 0:
+        status = 'match'
+    elif sovc_votes is None:
+        status = 'lvr_only'
+    elif lvr_votes is None:
+        status = 'sovc_only'
+    else:
+        status = 'mismatch'
+    return dict(status=status, race=race, choice=choice,
+                lvr_votes=lvr_votes, sovc_votes=sovc_votes, delta=delta)
+
+def summary(rows):
+    "RETURN: dict[status] => count of ROWS with that status (all statuses)"
+    counts = Counter(row['status'] for row in rows)
+    return {status: counts[status] for status in statuses}
+
+def write_csv(rows, csvfile):
+    with open(csvfile, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+
+def write_json(rows, jsonfile):
+    with open(jsonfile, 'w') as f:
+        json.dump(dict(summary=summary(rows), rows=rows), f, indent=1)
+
+def write_text(rows, textfile):
+    "Write one tab separated line per row that does not match."
+    with open(textfile, 'w') as f:
+        for row in rows:
+            if row['status'] == 'match':
+                continue
+            print('\t'.join(str(row[k]) for k in fieldnames), file=f)
+
+def write_html(rows, htmlfile):
+    "Write HTML table of rows that do not match."
+    cell = lambda v: '<td>{}</td>'.format(html.escape(
+        '' if v is None else str(v)))
+    with open(htmlfile, 'w') as f:
+        print('<!DOCTYPE html>\n<html><head><meta charset="utf-8">'
+              '<title>LVR vs SOVC</title></head><body>', file=f)
+        print('<p>{}</p>'.format(', '.join(
+            '{}: {}'.format(k, v) for k, v in summary(rows).items())),
+              file=f)
+        print('<table border="1">', file=f)
+        print('<tr>{}</tr>'.format(''.join('<th>{}</th>'.format(k)
+                                           for k in fieldnames)), file=f)
+        for row in rows:
+            if row['status'] == 'match':
+                continue
+            print('<tr>{}</tr>'.format(''.join(cell(row[k])
+                                               for k in fieldnames)), file=f)
+        print('</table></body></html>', file=f)
+
+def compare_totals(lvrdb, sovcdb,
+                   csvfile=None, jsonfile=None, htmlfile=None, textfile=None):
+    """Reconcile LVR totals against SOVC totals. Write each given output file.
+RETURN: dict[status] => count"""
+    rows = reconcile(lvr_totals(lvrdb), sovc_totals(sovcdb))
+    if csvfile:
+        write_csv(rows, csvfile)
+    if jsonfile:
+        write_json(rows, jsonfile)
+    if textfile:
+        write_text(rows, textfile)
+    if htmlfile:
+        write_html(rows, htmlfile)
+    return summary(rows)
+
+
+##############################################################################
+### Per precinct
+
+def lvr_precinct_votes(lvrdb):
+    """Count LVR votes by precinct and (LVR) choice id.  Use columnar
+sidecar if it is current, else SQL GROUP BY.
+RETURN: [(precinctCode, choiceId, votes), ...]"""
+    cols = LvrColumns(lvrdb)
+    if cols.is_current():
+        with cols:
+            return cols.precinct_votes()
+    con = sqlite3.connect(lvrdb)
+    try:
+        return con.execute(sql.lvr_precinct_choice_votes).fetchall()
+    finally:
+        con.close()
+
+def precinct_matrices(lvrdb, sovcdb, mapdb):
+    """Build (precinct x choice) vote count arrays for LVR and SOVC.
+Rows are SOVC precincts (in SOVC order) followed by precincts only in LVR.
+Columns are SOVC choice ids (minus skip_choices).
+RETURN: (precincts, choices, lvr, sovc)
+  precincts:: [precinctCode, ...]
+  choices:: [(sovcChoiceId, raceTitle, choiceTitle), ...]
+  lvr, sovc:: array of len(precincts)*len(choices);
+     count of precinct P, choice C at [P*len(choices) + C]"""
+    con = sqlite3.connect(sovcdb)
+    try:
+        precincts = [str(pc) for (pc,) in con.execute(sql.sovc_precinct_codes)]
+        choices = [(cid, rt, ct) for (rt, nv, ct, cid)
+                   in con.execute(sql.sovc_choice) if ct not in skip_choices]
+        sovc_votes = con.execute(sql.sovc_precinct_choice_votes).fetchall()
+    finally:
+        con.close()
+    con = sqlite3.connect(mapdb)
+    try:
+        choicemap = dict(con.execute(sql.map_choice_ids))
+    finally:
+        con.close()
+    lvr_votes = lvr_precinct_votes(lvrdb)
+
+    pidx = {pc: idx for idx, pc in enumerate(precincts)}
+    for (pc, cid, votes) in lvr_votes:
+        if str(pc) not in pidx:
+            pidx[str(pc)] = len(precincts)
+            precincts.append(str(pc))
+    cidx = {cid: idx for idx, (cid, rt, ct) in enumerate(choices)}
+    width = len(choices)
+
+    sovc = array('q', bytes(8 * len(precincts) * width))
+    for (pc, cid, votes) in sovc_votes:
+        if cid in cidx:
+            sovc[pidx[pc] * width + cidx[cid]] = votes
+    lvr = array('q', bytes(8 * len(precincts) * width))
+    for (pc, cid, votes) in lvr_votes:
+        col = cidx.get(choicemap.get(cid))
+        if col is not None:
+            lvr[pidx[str(pc)] * width + col] += votes
+    return precincts, choices, lvr, sovc
+
+def reconcile_precincts(precincts, choices, lvr, sovc):
+    """Diff LVR and SOVC (precinct x choice) arrays.
+RETURN: (ranking, details)
+  ranking:: [dict(rank, precinct, lvr_votes, sovc_votes, abs_delta,
+     choices_differ), ...]; most absolute difference first
+  details:: [dict(precinct, race, choice, lvr_votes, sovc_votes, delta), ...]
+     for every (precinct, choice) that differs"""
+    width = len(choices)
+    delta = array('q', map(operator.sub, lvr, sovc))
+    absdelta = list(map(abs, delta))
+    ranking = list()
+    details = list()
+    for (pi, pc) in enumerate(precincts):
+        lo, hi = pi * width, (pi + 1) * width
+        ranking.append(dict(precinct=pc,
+                            lvr_votes=sum(lvr[lo:hi]),
+                            sovc_votes=sum(sovc[lo:hi]),
+                            abs_delta=sum(absdelta[lo:hi]),
+                            choices_differ=width - absdelta[lo:hi].count(0)))
+    for idx in [i for i, d in enumerate(delta) if d != 0]:
+        (cid, rt, ct) = choices[idx % width]
+        details.append(dict(precinct=precincts[idx // width], race=rt,
+                            choice=ct, lvr_votes=lvr[idx],
+                            sovc_votes=sovc[idx], delta=delta[idx]))
+    ranking.sort(key=lambda r: r['abs_delta'], reverse=True)
+    for (rank, row) in enumerate(ranking, 1):
+        row['rank'] = rank
+    return ranking, details
+
+def print_ranking(ranking):
+    print('\t'.join(precinct_fieldnames))
+    for row in ranking:
+        print('\t'.join(str(row[k]) for k in precinct_fieldnames))
+
+def compare_precincts(lvrdb, sovcdb, mapdb, csvfile=None, detailfile=None):
+    """Reconcile LVR against SOVC per precinct.  Write ranking of precincts
+to CSVFILE and every differing (precinct, choice) to DETAILFILE.
+RETURN: ranking (see reconcile_precincts)"""
+    ranking, details = reconcile_precincts(
+        *precinct_matrices(lvrdb, sovcdb, mapdb))
+    if csvfile:
+        with open(csvfile, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=precinct_fieldnames)
+            writer.writeheader()
+            writer.writerows(ranking)
+    if detailfile:
+        with open(detailfile, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=['precinct'] + fieldnames[1:])
+            writer.writeheader()
+            writer.writerows(details)
+    return ranking
+
+
+##############################################################################
+
+def main():
+    "Parse command line arguments and do the work."
+    parser = argparse.ArgumentParser(
+        description='Reconcile LVR vote totals against SOVC county totals',
+        epilog='EXAMPLE: %(prog)s -l LVR.db -s SOVC.db --csv compare.csv'
+        )
+    parser.add_argument('--version', action='version', version='1.0.1')
+    parser.add_argument('--lvrdb', '-l', default='LVR.db',
+                        help='LVR sqlite DB (with summary_totals)')
+    parser.add_argument('--sovcdb', '-s', default='SOVC.db',
+                        help='SOVC sqlite DB')
+    parser.add_argument('--mapdb', '-m', default='MAP.db',
+                        help='MAP sqlite DB (for --precincts)')
+    parser.add_argument('--precincts',
+                        help=('Compare per precinct instead of totals;'
+                              ' write precinct ranking to this CSV file'))
+    parser.add_argument('--details',
+                        help=('With --precincts, write differing'
+                              ' (precinct, choice) rows to this CSV file'))
+    parser.add_argument('--top', type=int, default=10,
+                        help='With --precincts, print this many precincts')
+    parser.add_argument('--csv', help='Write all rows to this CSV file')
+    parser.add_argument('--json', help='Write all rows to this JSON file')
+    parser.add_argument('--html', help='Write mismatches to this HTML file')
+    parser.add_argument('--text', help='Write mismatches to this TEXT file')
+    parser.add_argument('--loglevel',
+                        help='Kind of diagnostic output',
+                        choices=['CRTICAL', 'ERROR', 'WARNING',
+                                 'INFO', 'DEBUG'],
+                        default='WARNING')
+    args = parser.parse_args()
+
+    log_level = getattr(logging, args.loglevel.upper(), None)
+    if not isinstance(log_level, int):
+        parser.error('Invalid log level: %s' % args.loglevel)
+    logging.basicConfig(level=log_level,
+                        format='%(levelname)s %(message)s',
+                        datefmt='%m-%d %H:%M')
+
+    if args.precincts:
+        ranking = compare_precincts(args.lvrdb, args.sovcdb, args.mapdb,
+                                    csvfile=args.precincts,
+                                    detailfile=args.details)
+        print_ranking(ranking[:args.top])
+        return
+
+    counts = compare_totals(args.lvrdb, args.sovcdb,
+                            csvfile=args.csv, jsonfile=args.json,
+                            htmlfile=args.html,
+                            textfile=args.text)
+    print(', '.join('{}: {}'.format(k, v) for k, v in counts.items()))
+
+if __name__ == '__main__':
+    main()
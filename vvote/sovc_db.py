@@ -25,6 +25,7 @@ from pprint import pprint, pformat
 #!from .sovc_sheet import SovcSheet
 import vvote.sql as sql
 from vvote.sovc_sheet import SovcSheet
+from vvote.exceptions import BadSovc
 
 ##############################################################################
 ### Database
@@ -82,13 +83,12 @@ SOVC Database Summary:
            ','.join([str(v) for v in va_choice_list]),  ))
 
     def insert_from_csv(self, csvfile):
-        """Append to existing Sqlite DB (or create new one). """
+        """Append to existing Sqlite DB (or create new one). 
+CSVFILE may also be an Excel (.xlsx) file; its rows are read directly."""
         self.new_db(overwrite=True)
-        sovcsheet = SovcSheet(csvfile)
+        sovcsheet = SovcSheet(csvfile, stream=True)
         self.sourcefile = sovcsheet.filename
-        choices = defaultdict(set) # of choice_title for each race
         cur = self.conn.cursor()
-        cells = sovcsheet.cells
 
         cur.execute('INSERT INTO source VALUES (?)', (csvfile,))
         
@@ -99,9 +99,16 @@ SOVC Database Summary:
         # common choices are cooked into SOVC headers
         #@@@ self.insert_common_choice_list(race_list)
 
-        (precinct_list, vote_list) = sovcsheet.get_precinct_votes()
-        self.insert_precinct_list(precinct_list)        
-        self.insert_vote_list(vote_list)        
+        # One precinct row (and its votes) in memory at a time
+        for (precinct, votes) in sovcsheet.precinct_votes():
+            self.insert_precinct_list([precinct])
+            self.insert_vote_list(votes)
+        try:
+            sovcsheet.check_errors()
+        except BadSovc:
+            self.conn.rollback()
+            self.conn.close()
+            raise
 
         self.close()
         #!logging.debug('DBG: Created RACE and CHOICE tables in {}'
@@ -121,31 +128,32 @@ SOVC Database Summary:
     def insert_precinct_list(self, precinct_list):
         """
         precinct_list::
-        [(-- race_id, # choice_id links to race_id
-          choice_id,
+        [(precinct_code,
           county_number,
-          precinct_code,
           precinct_name,
           num_registered_voters,
           ballots_cast_total,
           ballots_cast_blank,
           ), ...]"""
         cur = self.conn.cursor()
-        cur.executemany('INSERT INTO precinct VALUES (?,?,?,?,?,?,?)',
+        cur.executemany('INSERT INTO precinct VALUES (?,?,?,?,?,?)',
                         precinct_list)
     
     def insert_vote_list(self, vote_list):
-        """vote_list:: [(choice_id, precinct_code, count), ...]"""
+        """vote_list:: [(precinct_code, choice_id, count), ...]"""
         cur = self.conn.cursor()
         cur.executemany('INSERT INTO vote VALUES (?,?,?)', vote_list)
         
     # OUTPUT: Race, NumToVoteFor, Choice, ChoiceId, ...
     def to_csv(self,csv_filename):
+        """Write SOVC DB as CSV with one row per precinct and one column
+per choice.  Votes are read once (sorted by precinct, choice) and each
+precinct row is written as soon as it is complete."""
         self.conn = sqlite3.connect(self.dbfile)
         cur = self.conn.cursor()
 
-        rc_list = [(row['rt'], row['ct'], row['cid'])
-                   for row in cur.execute(sql.sovc_choice)]
+        rc_list = cur.execute(sql.sovc_choice).fetchall() # [(r,nv,c,cid),..]
+        colidx = dict((cid,idx) for (idx,(r,nv,c,cid)) in enumerate(rc_list))
         headers1 = ('COUNTY NUMBER,PRECINCT CODE,PRECINCT NAME,'
                     'REGISTERED VOTERS - TOTAL,BALLOTS CAST - TOTAL,'
                     'BALLOTS CAST - BLANK').split(',')
@@ -155,23 +163,25 @@ SOVC Database Summary:
         headers3 = ['Choice ->', '','','','','']
         headers3.extend([c for r,nv,c,cid in rc_list])
         
-        #!fns = 'county,pcode,pname,totvot,totbal,blankbal'.split(',')
-        #!fns.extend([c for r,c in rc_list])
         with open(csv_filename, 'w', newline='') as csvfile:
             writer = csv.writer(csvfile, dialect='excel')
             writer.writerow(headers1)
             writer.writerow(headers2)
             writer.writerow(headers3)
-            # loop over:
-            #   Precinct (by County/Precinct),
-            #   Race+Choice (by Race/Choice
-            for row in cur.execute(sql.sovc_precinct):
-                c6 = [row['county'], row['pcode'], row['pname'],
-                      row['totvot'], row['totbal'],row['blankbal']]
-                votes_list = list()
-                for row in cur.execute(sql.sovc_race): # for one precinct
-                    votes_list.append(row['count'])
+            # Pivot: rows are Precincts, columns are Race+Choice
+            c6 = None
+            votes_list = None
+            for (county,pcode,pname,totvot,totbal,blankbal,cid,count) \
+                in cur.execute(sql.sovc_pivot):
+                if (c6 == None) or (pcode != c6[1]): # new precinct
+                    if c6 != None:
+                        writer.writerow(c6 + votes_list)
+                    c6 = [county, pcode, pname, totvot, totbal, blankbal]
+                    votes_list = [''] * len(rc_list)
+                votes_list[colidx[cid]] = count
+            if c6 != None:
                 writer.writerow(c6 + votes_list)
+        self.conn.close()
             
 
 ### end SovcDb
@@ -193,13 +203,16 @@ def main():
     parser.add_argument('--version', action='version', version='1.0.1')
 
     parser.add_argument('--incsv', type=argparse.FileType('r'),
-                        help='Input CSV file to store into DB')
+                        help='Input CSV (or .xlsx) file to store into DB')
     parser.add_argument('-d', '--database', 
                         default=dfdb,
                         help=('SQlite database file to hold content.'
                               '  [default="{}"]').format(dfdb))
     parser.add_argument('--summary', '-s', action='store_true',
                         help='Summarize database content.')
+    parser.add_argument('--outcsv',
+                        help=('Write DB content as CSV (one row per'
+                              ' precinct) to this file'))
 
     parser.add_argument('--loglevel',
                         help='Kind of diagnostic output',
@@ -225,6 +238,8 @@ def main():
 
     if args.summary:
         db.summary()
+    if args.outcsv:
+        db.to_csv(args.outcsv)
     
 if __name__ == '__main__':
     main()
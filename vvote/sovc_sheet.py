@@ -1,11 +1,13 @@
 """\
-Read CSV SOVC file into object representing a spreadsheet.
+Read CSV (or Excel .xlsx) SOVC file into object representing a spreadsheet.
 
 Model as cells[row][column]=cellValue plus other bookkeeping instance variables.
 """
 import logging
 from collections import defaultdict
-import csv
+
+from vvote.utils import read_rows
+from vvote.exceptions import BadSovc
 
 class SovcSheet():
     """CSV format (per Nov-2017 results; '171107C_EXPORT DAY 2.CSV')
@@ -37,21 +39,53 @@ class SovcSheet():
     choiceLut = dict() # lut[title] = columnNumber
     raceLut = dict() # lut[title] = columnNumber (first column of race)
 
-    def __init__(self, filename):
-        """RETURN: sparse 2D matrix representing spreadsheet"""
+    def __init__(self, filename, stream=False):
+        """RETURN: sparse 2D matrix representing spreadsheet
+If STREAM, only the header rows (Race, Party, Choice titles) are read
+into cells.  Precinct rows are read from the file (one at a time) by
+rows()."""
         self.filename = filename
-        with open(filename, newline='') as csvfile:
-            sovcreader = csv.reader(csvfile, dialect='excel')
-            for ridx,row in enumerate(sovcreader, 1):
-                for cidx,val in enumerate(row,1):
-                    value = val.strip()
-                    if len(value) > 0:
-                        self.cells[ridx][cidx] = value
-                        self.max_col = max(self.max_col, cidx)
-                if (ridx >= self.minDataR) and (len(self.cells[ridx]) > 4):
-                    self.max_row = ridx
+        self.stream = stream
+        self.cells = defaultdict(dict)
+        self.choiceLut = dict()
+        self.raceLut = dict()
+        self.errors = list() # [(row, column, value, reason), ...]
+        for ridx,row in enumerate(read_rows(filename), 1):
+            if stream and (ridx >= self.minDataR):
+                break
+            self.cells[ridx] = self.row_cells(row)
+            if len(self.cells[ridx]) > 0:
+                self.max_col = max(self.max_col, max(self.cells[ridx]))
+            if (ridx >= self.minDataR) and (len(self.cells[ridx]) > 4):
+                self.max_row = ridx
         # END: init
 
+    @staticmethod
+    def row_cells(row):
+        """RETURN: dict[columnId] => value; for non-blank values of ROW"""
+        cells = dict()
+        for cidx,val in enumerate(row,1):
+            value = val.strip()
+            if len(value) > 0:
+                cells[cidx] = value
+        return cells
+
+    def rows(self):
+        """Generate (rowId, dict[columnId] => value) for each precinct row
+(last one is COUNTY TOTALS).  If sheet was created with STREAM, rows are
+read (one at a time) from file."""
+        if not self.stream:
+            for ridx in range(self.minDataR, self.max_row + 1):
+                yield ridx, self.cells[ridx]
+            return
+        for ridx,row in enumerate(read_rows(self.filename), 1):
+            if ridx < self.minDataR:
+                continue
+            cells = self.row_cells(row)
+            if len(cells) > 4:
+                self.max_row = ridx
+                yield ridx, cells
+
     def summary(self):
         print('''
 Sheet Summary:
@@ -105,33 +139,59 @@ Sheet Summary:
                 break
         return race_list, choice_list
         
-    def get_precinct_votes(self):
-        "RETURN: dict[(race,choice)] => (count,precinct,regvot,baltot,balblank)"
-        logging.debug('Get PRECINCT and VOTE lists')
+    def count(self, ridx, cidx, cells):
+        """RETURN: integer count in cell (RIDX,CIDX) of CELLS (of row RIDX).
+Bad (blank, not a whole non-negative number) cells are recorded in
+self.errors and counted as 0."""
+        value = cells.get(cidx)
+        try:
+            if value == None:
+                raise ValueError('blank')
+            try:
+                count = int(value)
+            except ValueError:
+                try:
+                    number = float(value)  # Excel may give "12.0"
+                except ValueError:
+                    raise ValueError('not a number')
+                if not number.is_integer():
+                    raise ValueError('not a whole number')
+                count = int(number)
+            if count < 0:
+                raise ValueError('negative')
+        except ValueError as err:
+            reason = 'blank' if value == None else str(err)
+            self.errors.append((ridx, cidx, value, reason))
+            return 0
+        return count
+
+    def check_errors(self, maxshow=20):
+        "Raise BadSovc (listing bad cells) if any were found"
+        if len(self.errors) == 0:
+            return
+        for (ridx, cidx, value, reason) in self.errors[:maxshow]:
+            logging.error('Bad count in {} row {}, column {}: {!r} ({})'
+                          .format(self.filename, ridx, cidx, value, reason))
+        raise BadSovc('{} bad count cells in {}; first at row {}, column {}'
+                      .format(len(self.errors), self.filename,
+                              *self.errors[0][:2]))
 
-        precinct_list = list() # [(race_id, choice_id, county, pcode, pname,
-                               # regvot, baltot, balblank), ...]
-        vote_list = list()     # [(cid, precinct_code, count), ...]
-        for col in range(self.minDataC, self.max_col+1):
-            racetitle = self.cells[self.raceR][col]
-            race_id = self.raceLut[racetitle]
-            choicetitle = self.cells[self.choiceR][col]
-            #@@@ choice_id = self.choiceLut[choicetitle]
-            choice_id = col
-            for row in range(self.minDataR, self.max_row+1):
-                precinct_list.append(
-                    (# race_id,
-                     choice_id,
-                     self.cells[row][1],   # county number
-                     self.cells[row][2],   # precinct code
-                     self.cells[row][3],   # precinct name
-                     self.cells[row][4],   # reg voters total
-                     self.cells[row][5],   # ballots total
-                     self.cells[row][6]    # ballots blank
-                    ))
-                vote_list.append(
-                    (choice_id,
-                     self.cells[row][2],  # precinct code
-                     self.cells[row][col] # vote count
-                    ))
-        return (precinct_list, vote_list)
+    def precinct_votes(self):
+        """Generate (precinct, votes) for each precinct row.  Counts
+(registered voters, ballots and votes) are integers.  Call check_errors()
+after all rows are read.
+  precinct :: (precinct_code, county_number, precinct_name,
+               regvot, baltot, balblank)
+  votes :: [(precinct_code, choice_id, count), ...]; one per choice column"""
+        logging.debug('Get PRECINCT and VOTE rows')
+        choice_ids = range(self.minDataC, self.max_col+1) # choice_id = col
+        for (ridx,cells) in self.rows():
+            pcode = cells.get(2)
+            precinct = (pcode,
+                        cells.get(1),   # county number
+                        cells.get(3),   # precinct name
+                        self.count(ridx, 4, cells),   # reg voters total
+                        self.count(ridx, 5, cells),   # ballots total
+                        self.count(ridx, 6, cells))   # ballots blank
+            yield (precinct, [(pcode, col, self.count(ridx, col, cells))
+                              for col in choice_ids])
@@ -5,9 +5,10 @@ SQL commands (possibly) used in the python code.
 #############################################################################
 ### LVR
 ###
-lvr_schema = '''
+lvr_tables = '''
 CREATE TABLE source (
-   filename text
+   filename text,
+   sha256 text  -- of file content; file is not ingested again (append)
 );
 CREATE TABLE race (
    race_id integer primary key,
@@ -24,19 +25,81 @@ CREATE TABLE cvr (
    precinct_code integer,
    ballot_style text
 );
-CREATE TABLE vote (
-   cvr_id integer,
-   choice_id integer
-);
 CREATE TABLE summary_totals (
    race text,
    choice text,
    votes integer
 );
 '''
+# Vote table layouts.  Queries must work against either one.
+#   rowid     :: heap in ingest (CVR) order
+#   clustered :: B-tree ordered by choice; counts per choice are range scans
+lvr_vote_rowid = '''
+CREATE TABLE vote (
+   cvr_id integer,
+   choice_id integer
+);
+'''
+lvr_vote_clustered = '''
+CREATE TABLE vote (
+   choice_id integer,
+   cvr_id integer,
+   seq integer,     -- 0,1,.. when CVR has same choice more than once (undervote)
+   race_id integer, -- denormalized from choice
+   PRIMARY KEY (choice_id, cvr_id, seq)
+) WITHOUT ROWID;
+'''
+lvr_layouts = ['rowid', 'clustered']
+lvr_schema = lvr_tables + lvr_vote_rowid
+lvr_schemas = dict(rowid=lvr_schema,
+                   clustered=lvr_tables + lvr_vote_clustered)
+# Vote rows are (cvr_id, choice_id) or (cvr_id, choice_id, race_id, seq)
+lvr_insert_vote = dict(
+    rowid='INSERT INTO vote (cvr_id, choice_id) VALUES (?,?)',
+    clustered=('INSERT INTO vote (cvr_id, choice_id, race_id, seq)'
+               ' VALUES (?,?,?,?)'))
+lvr_vote_layout = '''SELECT sql FROM sqlite_master
+WHERE type = 'table' AND name = 'vote';'''
+
+# Built after (bulk) load so inserts do not maintain indexes.
+#   vote_choice_cvr :: tally (GROUP BY choice); covering
+#   choice_race     :: choices per race; covering
+# Per-precinct counts scan vote (in CVR order) and look up cvr by key;
+# no second index on vote (it would be as big as vote itself; earlier
+# versions made vote_cvr_choice).
+lvr_indexes = '''
+CREATE INDEX IF NOT EXISTS vote_choice_cvr ON vote (choice_id, cvr_id);
+DROP INDEX IF EXISTS vote_cvr_choice;
+CREATE INDEX IF NOT EXISTS choice_race ON choice (race_id, choice_id, title);
+ANALYZE;
+'''
+# Clustered vote table is already ordered by (choice_id, cvr_id)
+#   vote_cvr :: per-precinct (join cvr) and export (ORDER BY cvr)
+#   vote_race :: per-race queries
+lvr_clustered_indexes = '''
+CREATE INDEX IF NOT EXISTS vote_cvr ON vote (cvr_id);
+CREATE INDEX IF NOT EXISTS vote_race ON vote (race_id);
+CREATE INDEX IF NOT EXISTS choice_race ON choice (race_id, choice_id, title);
+ANALYZE;
+'''
+lvr_index_sets = dict(rowid=lvr_indexes, clustered=lvr_clustered_indexes)
+
+# Ingest-time settings used for bulk load.  NOT crash safe: a failed
+# ingest leaves a corrupt LVR.db (which is simply re-ingested).
+# Not used when appending to an existing LVR.db.
+lvr_ingest_pragmas = '''
+PRAGMA synchronous = OFF;
+PRAGMA journal_mode = MEMORY;
+PRAGMA cache_size = -200000; -- KiB
+'''
+# Restore (default) durable settings once bulk load is committed.
+lvr_durable_pragmas = '''
+PRAGMA synchronous = FULL;
+PRAGMA journal_mode = DELETE;
+'''
 
 ###################
-lvr_choice = 'SELECT choice.choice_id, choice.title, choice_race+id FROM choice;'
+lvr_choice = 'SELECT choice.choice_id, choice.title, choice.race_id FROM choice;'
 lvr_race = 'SELECT race.race_id, race.title FROM race;'
 lvr_choices = '''SELECT 
   choice.race_id,
@@ -74,6 +137,33 @@ WHERE vote.cvr_id = cvr.cvr_id
 GROUP BY pc, rt, ct
 ORDER BY CAST(pc AS INTEGER), rt, ct; '''
 
+# Count of votes by Precinct, ChoiceId (integer ids; no MAP.db needed)
+lvr_precinct_choice_votes = '''
+SELECT cvr.precinct_code as pc, vote.choice_id as cid, count(*) as votes
+FROM vote JOIN cvr ON vote.cvr_id = cvr.cvr_id
+GROUP BY pc, cid;'''
+
+###################
+# Columnar sidecar (see lvr_columns.py)
+lvr_columns_vote = 'SELECT cvr_id, choice_id FROM vote;'
+lvr_columns_cvr = '''SELECT cvr_id, precinct_code, ballot_style
+FROM cvr ORDER BY cvr_id;'''
+lvr_columns_choice = '''SELECT choice_id, race_id
+FROM choice ORDER BY choice_id;'''
+lvr_source_digests = 'SELECT sha256 FROM source;'
+lvr_cvr_ids = 'SELECT cvr_id FROM cvr;'
+lvr_vote_choice_ids = 'SELECT choice_id FROM vote;'
+# Changes whenever CVRs, votes, choices or source files are added
+# (columnar sidecar is stale)
+lvr_columns_fingerprint = '''SELECT
+  (SELECT count(*) FROM cvr),
+  (SELECT max(cvr_id) FROM cvr),
+  (SELECT count(*) FROM vote),
+  (SELECT count(*) FROM choice),
+  (SELECT group_concat(sha256) FROM (SELECT sha256 FROM source ORDER BY rowid));'''
+
+lvr_summary_totals = 'SELECT race, choice, votes FROM summary_totals;'
+
 # Count of votes by RaceId, ChoiceId
 lvr_total_votes = '''
 SELECT 
@@ -122,21 +212,21 @@ CREATE TABLE choice (
    race_id integer,
    party text
 );
+-- One row per precinct row of SOVC (including 'ZZZ', COUNTY TOTALS)
 CREATE TABLE precinct (
-  -- race_id integer,
-  choice_id integer,
+  precinct_code text primary key,
   county_number,
-  precinct_code,  -- id
   precinct_name,
-  registered_voters integer,
-  ballots_cast_total integer,
-  ballots_cast_blank integer
+  registered_voters integer NOT NULL,
+  ballots_cast_total integer NOT NULL,
+  ballots_cast_blank integer NOT NULL
 );
 CREATE TABLE vote (
+  precinct_code text,
   choice_id integer,
-  precinct_code,
-  count integer
-);
+  count integer NOT NULL, -- validated at ingest (see SovcSheet.count)
+  PRIMARY KEY (precinct_code, choice_id)
+) WITHOUT ROWID;
 '''
 
 ###################
@@ -155,7 +245,7 @@ sovc_choice = '''SELECT
   choice.choice_id as cid
 FROM choice, race
 WHERE race.race_id = choice.race_id 
-ORDER BY race_id ASC, choice_id ASC;'''
+ORDER BY choice.race_id ASC, choice.choice_id ASC;'''
 
 sovc_precinct = '''SELECT 
   precinct.county_number AS county,
@@ -163,16 +253,23 @@ sovc_precinct = '''SELECT
   precinct.precinct_name AS pname,
   precinct.registered_voters AS totvot,
   precinct.ballots_cast_total AS totbal,
-  precinct.ballots_cast_blank AS blankbal,
+  precinct.ballots_cast_blank AS blankbal
 FROM precinct 
 ORDER BY precinct.county_number ASC, pcode ASC;'''
 
-sovc_race = '''SELECT vote.count AS count
-FROM vote, precinct
-WHERE vote.precinct_code = precinct.precinct_code
-ORDER BY race_id
-;
-'''
+# Votes of every precinct (in SOVC row order) by choice (in column order).
+# choice_id is the SOVC column so it also orders by race.
+sovc_pivot = '''SELECT 
+  precinct.county_number AS county,
+  precinct.precinct_code AS pcode,
+  precinct.precinct_name AS pname,
+  precinct.registered_voters AS totvot,
+  precinct.ballots_cast_total AS totbal,
+  precinct.ballots_cast_blank AS blankbal,
+  vote.choice_id AS cid,
+  vote.count AS count
+FROM precinct JOIN vote ON vote.precinct_code = precinct.precinct_code
+ORDER BY precinct.rowid, vote.choice_id;'''
 
 ###################
 # Votes
@@ -202,6 +299,18 @@ WHERE vote.choice_id = choice.choice_id AND choice.race_id = race.race_id
 GROUP BY pc, rt, ct
 ORDER BY CAST(pc AS INTEGER), rt, ct;'''
 
+sovc_precinct_codes = '''SELECT precinct_code FROM precinct
+WHERE precinct_code <> 'ZZZ' ORDER BY rowid;'''
+sovc_precinct_choice_votes = '''SELECT precinct_code, choice_id, count
+FROM vote WHERE precinct_code <> 'ZZZ';'''
+
+# County totals (precinct 'ZZZ') for every choice, including 0 votes
+sovc_county_totals = '''
+SELECT race.title as rt, choice.title as ct, vote.count as votes
+FROM vote, choice, race
+WHERE vote.precinct_code = 'ZZZ'
+  AND vote.choice_id = choice.choice_id AND choice.race_id = race.race_id;'''
+
 ##############################################################################
 ### MAP
 ###
@@ -244,7 +353,8 @@ CREATE TABLE race_map (
    lvr_race_id integer,
    lvr_race_title text,
    sovc_race_id integer,
-   sovc_race_title text
+   sovc_race_title text,
+   origin text -- 'calc' (by MapDb.calc) or 'import' (edited map)
 );
 -- Map LVR Choice titles to SOVC Choice titles
 CREATE TABLE choice_map (
@@ -253,8 +363,35 @@ CREATE TABLE choice_map (
    lvr_choice_id integer,
    lvr_choice_title text,
    sovc_choice_id integer,
-   sovc_choice_title text
+   sovc_choice_title text,
+   origin text -- 'calc' (by MapDb.calc) or 'import' (edited map)
+);
+'''
+# Scores of title pairs already compared (reused by later map calculations)
+map_similarity_schema = '''
+CREATE TABLE IF NOT EXISTS similarity (
+   lvr_title text,
+   sovc_title text,
+   ratio real, -- SequenceMatcher ratio of the (cleaned) titles
+   PRIMARY KEY (lvr_title, sovc_title)
+) WITHOUT ROWID;'''
+map_schema += map_similarity_schema
+# Source DB files the lvr_* and sovc_* LUT tables were copied from
+map_snapshot_schema = '''
+CREATE TABLE IF NOT EXISTS snapshot (
+   src text PRIMARY KEY, -- 'lvr' or 'sovc'
+   filename text,
+   fingerprint text,     -- of file when LUTs were copied (size:mtime_ns)
+   version integer       -- MapDb.snapshot_version
 );'''
+map_schema += map_snapshot_schema
+
+map_snapshot = '''SELECT filename, fingerprint, version
+FROM snapshot WHERE src = ?;'''
+
+map_similarity = '''SELECT lvr_title, sovc_title, ratio FROM similarity;'''
+map_insert_similarity = '''INSERT OR REPLACE INTO similarity
+VALUES (?,?,?);'''
 
 race_map = '''SELECT
    confidence,
@@ -264,6 +401,14 @@ race_map = '''SELECT
    sovc_race_title AS sti
 FROM race_map ORDER BY lti;'''
 
+# All columns (map rows as stored)
+map_race_rows = '''SELECT confidence, lvr_race_id, lvr_race_title,
+   sovc_race_id, sovc_race_title, origin
+FROM race_map;'''
+map_choice_rows = '''SELECT confidence, lvr_race_id, lvr_choice_id,
+   lvr_choice_title, sovc_choice_id, sovc_choice_title, origin
+FROM choice_map;'''
+
 choice_map = '''SELECT
    confidence,
    lvr_race_id AS lrid,
@@ -283,16 +428,7 @@ map_lvr_rc = '''SELECT DISTINCT
   choice.title AS ct,
   choice.choice_id AS cid
 FROM vote,race,choice 
-WHERE vote.race_id = race.race_id AND vote.choice_id = choice.choice_id 
-ORDER BY rt, ct;'''
-
-map_sovc_rc = '''SELECT DISTINCT 
-  race.title AS rt, 
-  race.race_id AS rid, 
-  choice.title AS ct,
-  choice.choice_id AS cid 
-FROM precinct,race,choice 
-WHERE precinct.race_id = race.race_id AND precinct.choice_id = choice.choice_id 
+WHERE choice.race_id = race.race_id AND vote.choice_id = choice.choice_id 
 ORDER BY rt, ct;'''
 
 map_tpl = '''SELECT 
@@ -301,5 +437,57 @@ map_tpl = '''SELECT
   {src}_choice.choice_id as cid,
   {src}_choice.title     as cti
 FROM {src}_race, {src}_choice, {src}_rc
-WHERE {src}_rc.race_id = rid AND {src}_rc.choice_id = cid;'''
+WHERE {src}_rc.race_id = rid AND {src}_rc.choice_id = cid
+ORDER BY {src}_rc.rowid;'''
     
+
+
+#############################################################################
+### ALIAS (LVR=>SOVC titles confirmed in earlier elections)
+###
+alias_schema = '''
+CREATE TABLE IF NOT EXISTS alias (
+   kind text,       -- 'race' or 'choice'
+   scope text,      -- SOVC race title of choice; '' for race
+   lvr_title text,  -- cleaned (see clean.py)
+   sovc_title text,
+   count integer,   -- number of imported maps that confirmed it
+   PRIMARY KEY (kind, scope, lvr_title, sovc_title)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS alias_source (
+   digest text primary key, -- sha256 of confirmed pairs of one imported map
+   mapdb text
+);'''
+
+alias_add = '''INSERT INTO alias VALUES (?,?,?,?,1)
+ON CONFLICT (kind, scope, lvr_title, sovc_title)
+DO UPDATE SET count = count + 1;'''
+
+alias_source = 'SELECT 1 FROM alias_source WHERE digest = ?;'
+alias_add_source = 'INSERT INTO alias_source VALUES (?,?);'
+
+# Most confirmed first (first one wins on lookup)
+alias_all = '''SELECT kind, scope, lvr_title, sovc_title, count
+FROM alias ORDER BY kind, scope, lvr_title, count DESC, sovc_title;'''
+
+alias_lookup = '''SELECT sovc_title FROM alias
+WHERE kind = ? AND scope = ? AND lvr_title = ?
+ORDER BY count DESC, sovc_title LIMIT 1;'''
+
+# Choice map by (integer) id for per-precinct reconcile
+map_choice_ids = '''SELECT lvr_choice_id, sovc_choice_id FROM choice_map
+WHERE sovc_choice_id IS NOT NULL AND sovc_choice_id != '';'''
+
+map_imported_races = '''SELECT '', lvr_race_title, sovc_race_title
+FROM race_map
+WHERE origin = 'import' AND lvr_race_id IS NOT NULL
+  AND sovc_race_id IS NOT NULL AND sovc_race_id != '';'''
+
+# Scope of choice is title of SOVC race its LVR race is mapped to
+map_imported_choices = '''SELECT race_map.sovc_race_title,
+  choice_map.lvr_choice_title, choice_map.sovc_choice_title
+FROM choice_map JOIN race_map ON choice_map.lvr_race_id = race_map.lvr_race_id
+WHERE choice_map.origin = 'import' AND choice_map.lvr_choice_id IS NOT NULL
+  AND choice_map.sovc_choice_id IS NOT NULL
+  AND choice_map.sovc_choice_id != ''
+  AND race_map.sovc_race_id IS NOT NULL AND race_map.sovc_race_id != '';'''
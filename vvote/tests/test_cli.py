@@ -10,6 +10,7 @@ import sys
 import os
 import os.path
 import io
+import csv
 from pathlib import PurePath
 from contextlib import contextmanager
 
@@ -65,6 +66,8 @@ class TestCli(unittest.TestCase):
         self.choicemap = str(self.datadir / 'CHOICEMAP.csv')
         self.htmlfile = str(self.datadir / 'diff.html')
         self.textfile = str(self.datadir / 'diff.txt')
+        self.csvfile = str(self.datadir / 'compare.csv')
+        self.precinctfile = str(self.datadir / 'precincts.csv')
 
         self.vcli=cli.VvoteShell(datadir=self.datadir)
 
@@ -106,6 +109,17 @@ class TestCli(unittest.TestCase):
     def test_8compare_totals(self):
         self.vcli.onecmd('compare_totals')
         self.assertEqual(0,      os.path.getsize(self.textfile))
-        self.assertEqual(170927, os.path.getsize(self.htmlfile))
+        self.assertTrue(os.path.exists(self.htmlfile))
+        with open(self.csvfile) as f:
+            statuses = {line.split(',')[0] for line in f.readlines()[1:]}
+        self.assertEqual({'match'}, statuses)
+
+    def test_9compare_precincts(self):
+        self.vcli.onecmd('compare_precincts')
+        with open(self.precinctfile) as f:
+            rows = list(csv.DictReader(f))
+        self.assertTrue(len(rows) > 0)
+        deltas = [int(row['abs_delta']) for row in rows]
+        self.assertEqual(sorted(deltas, reverse=True), deltas)
 
         
@@ -0,0 +1,84 @@
+# EXAMPLE:
+#   python -m unittest vvote/tests/test_explain.py
+import unittest
+import os.path
+import sqlite3
+import tempfile
+
+from vvote.lvr_db import LvrDb
+from vvote.sovc_db import SovcDb
+from vvote.mapping_db import MapDb
+from vvote.alias_db import AliasDb
+from vvote.explain import query_list, query_plan, flag_step
+
+LVR_CSV = '''\
+Cast Vote Record,Precinct,Ballot Style,MAYOR,COUNCIL
+1,101,BS-1,SMITH,JONES
+2,101,BS-1,DOE,undervote
+3,102,BS-2,SMITH,BROWN
+'''
+SOVC_CSV = '''\
+COUNTY NUMBER,PRECINCT CODE,PRECINCT NAME,REGISTERED VOTERS - TOTAL,BALLOTS CAST - TOTAL,BALLOTS CAST - BLANK,MAYOR,MAYOR,MAYOR,COUNCIL,COUNCIL,COUNCIL
+,,,,,,,,,,,
+,,,VOTERS,BALLOTS CAST,BALLOTS CAST,SMITH,DOE,UNDER VOTES,JONES,BROWN,UNDER VOTES
+1,101,P101,100,2,0,1,1,0,1,0,1
+1,102,P102,100,1,0,1,0,0,0,1,0
+1,ZZZ,COUNTY TOTALS,200,3,0,2,1,0,1,1,1
+'''
+
+class TestExplain(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        path = lambda name: os.path.join(self.tmpdir.name, name)
+        for (name, content) in [('lvr.csv', LVR_CSV), ('sovc.csv', SOVC_CSV)]:
+            with open(path(name), 'w') as f:
+                f.write(content)
+        self.dbfiles = dict(LVR=path('LVR.db'), SOVC=path('SOVC.db'),
+                            MAP=path('MAP.db'), ALIAS=path('ALIAS.db'))
+        self.csvfile = path('lvr.csv')
+        SovcDb(self.dbfiles['SOVC']).insert_from_csv(path('sovc.csv'))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def build(self, layout):
+        "Make LVR.db with vote LAYOUT, then MAP.db and ALIAS.db from it"
+        LvrDb(self.dbfiles['LVR']).insert_from_csv(self.csvfile,
+                                                   layout=layout)
+        with MapDb(self.dbfiles['MAP'], new=True) as mdb:
+            mdb.get_lvr_luts(self.dbfiles['LVR'])
+            mdb.get_sovc_luts(self.dbfiles['SOVC'])
+            mdb.calc()
+            with AliasDb(self.dbfiles['ALIAS']) as adb:
+                adb.add_maps(mdb.con, mapdb=self.dbfiles['MAP'])
+
+    def check_plans(self, layout):
+        self.build(layout)
+        plans = dict()
+        for (name, kind, attach_list, text) in query_list():
+            try:
+                plans[name] = query_plan(self.dbfiles, kind, attach_list, text)
+            except sqlite3.Error as err:
+                self.fail('{} [{}]: {}'.format(name, kind, err))
+        self.assertEqual([], [detail for detail in plans['lvr_total_votes']
+                              if flag_step(detail) == 'FULL SCAN'
+                              and 'vote' in detail.split()])
+
+    def test_rowid(self):
+        self.check_plans('rowid')
+
+    def test_clustered(self):
+        self.check_plans('clustered')
+
+    def test_rowid_indexes(self):
+        self.build('rowid')
+        con = sqlite3.connect(self.dbfiles['LVR'])
+        indexes = [name for (name,) in con.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index'"
+            " AND tbl_name = 'vote' ORDER BY name;")]
+        con.close()
+        self.assertEqual(['vote_choice_cvr'], indexes)
+
+if __name__ == '__main__':
+    unittest.main()
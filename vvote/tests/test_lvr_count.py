@@ -0,0 +1,74 @@
+# EXAMPLE:
+#   python -m unittest vvote/tests/test_lvr_count.py
+import unittest
+import os.path
+import tempfile
+
+from vvote.lvr_db import LvrDb
+from vvote.lvr_columns import LvrColumns, bincount
+from vvote.lvr_count import (lvr_choice_votes, lvr_choice_votes_sql,
+                             lvr_count_check)
+
+LVR_CSV = '''\
+Cast Vote Record,Precinct,Ballot Style,MAYOR,COUNCIL,
+1,101,BS-1,SMITH,JONES,BROWN
+2,101,BS-1,DOE,undervote,undervote
+3,102,BS-2,SMITH,BROWN,
+4,102,BS-2,,,
+5,103,BS-1,SMITH,JONES,GREEN
+'''
+
+class TestBincount(unittest.TestCase):
+
+    def test_bincount(self):
+        self.assertEqual([0, 2, 0, 1], bincount([1, 3, 1]))
+        self.assertEqual([1, 0, 0, 0, 0], bincount([0], minlength=5))
+        self.assertEqual([], bincount([]))
+        self.assertEqual([0, 0], bincount(iter([]), minlength=2))
+
+
+class TestLvrCount(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.csvfile = os.path.join(self.tmpdir.name, 'lvr.csv')
+        with open(self.csvfile, 'w') as f:
+            f.write(LVR_CSV)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def check_tallies(self, layout):
+        lvrdb = os.path.join(self.tmpdir.name, layout + '.db')
+        LvrDb(lvrdb).insert_from_csv(self.csvfile, layout=layout)
+        expected = lvr_choice_votes_sql(lvrdb)
+        self.assertEqual(11, sum(votes for (rid,cid,votes) in expected))
+
+        # without sidecar; choice ids loaded from LVR.db
+        self.assertFalse(LvrColumns(lvrdb).is_current())
+        self.assertEqual(expected, lvr_choice_votes(lvrdb))
+        self.assertEqual([], lvr_count_check(lvrdb))
+
+        # with (current) sidecar
+        LvrColumns(lvrdb).write()
+        self.assertTrue(LvrColumns(lvrdb).is_current())
+        self.assertEqual(expected, lvr_choice_votes(lvrdb))
+        self.assertEqual([], lvr_count_check(lvrdb))
+
+        # sidecar is stale after more ballots are appended
+        with open(self.csvfile, 'a') as f:
+            f.write('6,103,BS-1,DOE,GREEN,\n')
+        LvrDb(lvrdb).insert_from_csv(self.csvfile, layout=layout, append=True)
+        self.assertFalse(LvrColumns(lvrdb).is_current())
+        self.assertEqual(13, sum(votes for (rid,cid,votes)
+                                 in lvr_choice_votes(lvrdb)))
+        self.assertEqual([], lvr_count_check(lvrdb))
+
+    def test_rowid(self):
+        self.check_tallies('rowid')
+
+    def test_clustered(self):
+        self.check_tallies('clustered')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+# EXAMPLE:
+#   python -m unittest vvote/tests/test_lvr_sheet.py
+import unittest
+import os.path
+import sqlite3
+import tempfile
+
+from vvote.lvr_sheet import LvrSheet
+from vvote.lvr_db import LvrDb
+
+# CVR 2 is a blank ballot (no votes); row 5 is empty
+LVR_CSV = '''\
+Cast Vote Record,Precinct,Ballot Style,PRESIDENT,COUNCIL,
+1,101,BS-1,CLINTON,SMITH,JONES
+2,101,BS-1,,,
+3,102,BS-2,TRUMP,,undervote
+,,,,,
+4,102,BS-2,overvote,JONES,
+'''
+# COUNCIL is vote for 2; no ballot has a second COUNCIL vote
+UNUSED_CSV = '''\
+Cast Vote Record,Precinct,Ballot Style,MAYOR,COUNCIL,
+1,101,BS-1,SMITH,JONES,
+2,101,BS-1,DOE,,
+'''
+
+class TestLvrSheet(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.csvfile = os.path.join(self.tmpdir.name, 'lvr.csv')
+        with open(self.csvfile, 'w') as f:
+            f.write(LVR_CSV)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_stream_rows(self):
+        sheet = LvrSheet(self.csvfile)
+        rows = list(sheet.rows())
+        self.assertEqual(['1', '2', '3', '4'],
+                         [cells[1] for (rid,cells) in rows])
+        self.assertEqual({1: '2', 2: '101', 3: 'BS-1'}, rows[1][1])
+        self.assertEqual(rows, list(LvrSheet(self.csvfile, stream=True).rows()))
+        self.assertEqual({'PRESIDENT': 1, 'COUNCIL': 2}, sheet.voteFor)
+
+    def test_unused_column(self):
+        with open(self.csvfile, 'w') as f:
+            f.write(UNUSED_CSV)
+        for stream in (False, True):
+            sheet = LvrSheet(self.csvfile, stream=stream)
+            self.assertEqual(6, sheet.max_col)
+            self.assertEqual({'MAYOR': 1, 'COUNCIL': 2}, sheet.voteFor)
+            self.assertEqual({'MAYOR': 4, 'COUNCIL': 5}, sheet.raceLut)
+        dbfile = lambda stream: os.path.join(self.tmpdir.name,
+                                             'LVR-{}.db'.format(stream))
+        races = list()
+        for stream in (False, True):
+            LvrDb(dbfile(stream)).insert_from_csv(self.csvfile, stream=stream)
+            con = sqlite3.connect(dbfile(stream))
+            races.append(con.execute('SELECT * FROM race'
+                                     ' ORDER BY race_id;').fetchall())
+            con.close()
+        self.assertEqual(races[0], races[1])
+        self.assertEqual([1, 2], sorted(row[1] for row in races[0]))
+
+    def ingest(self, dbname, **kwargs):
+        "RETURN: (ballots, cvr rows, vote rows) of CSV ingested with KWARGS"
+        dbfile = os.path.join(self.tmpdir.name, dbname)
+        (ballots, elapsed) = LvrDb(dbfile).insert_from_csv(self.csvfile,
+                                                            **kwargs)
+        con = sqlite3.connect(dbfile)
+        cvrs = con.execute('SELECT * FROM cvr ORDER BY cvr_id;').fetchall()
+        votes = con.execute('''SELECT vote.cvr_id, choice.title
+FROM vote, choice WHERE vote.choice_id = choice.choice_id
+ORDER BY vote.cvr_id, choice.title;''').fetchall()
+        con.close()
+        return ballots, cvrs, votes
+
+    def test_stream_ingest(self):
+        (ballots, cvrs, votes) = self.ingest('LVR.db')
+        self.assertEqual(4, ballots)
+        self.assertEqual([1, 2, 3, 4], [cvr[0] for cvr in cvrs])
+        self.assertEqual(7, len(votes))
+        self.assertEqual((ballots, cvrs, votes),
+                         self.ingest('LVR-stream.db', stream=True))
+        self.assertEqual((ballots, cvrs, votes),
+                         self.ingest('LVR-bulk.db', stream=True, bulk=True))
+
+if __name__ == '__main__':
+    unittest.main()
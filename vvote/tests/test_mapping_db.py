@@ -0,0 +1,245 @@
+# EXAMPLE:
+#   python -m unittest vvote/tests/test_mapping_db.py
+import unittest
+import os.path
+import csv
+import random
+import sqlite3
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import permutations
+from unittest import mock
+
+from vvote.lvr_db import LvrDb
+from vvote.sovc_db import SovcDb
+from vvote.mapping_db import MapDb, optimal_assignment, candidate_pairs
+from vvote.alias_db import AliasDb
+from vvote.exceptions import BadMap
+
+# SHERIFF is only in the LVR
+LVR_CSV = '''\
+Cast Vote Record,Precinct,Ballot Style,MAYOR,COUNCIL,SHERIFF
+1,101,BS-1,SMITH,JONES,KANE
+2,101,BS-1,DOE,undervote,ABEL
+3,102,BS-2,SMITH,BROWN,overvote
+'''
+SOVC_CSV = '''\
+COUNTY NUMBER,PRECINCT CODE,PRECINCT NAME,REGISTERED VOTERS - TOTAL,BALLOTS CAST - TOTAL,BALLOTS CAST - BLANK,MAYOR,MAYOR,MAYOR,MAYOR,COUNCIL,COUNCIL,COUNCIL,COUNCIL
+,,,,,,DEM,REP,,,,,,
+,,,VOTERS,BALLOTS CAST,BALLOTS CAST,JOHN SMITH,JANE DOE,OVER VOTES,UNDER VOTES,ANN JONES,BOB BROWN,OVER VOTES,UNDER VOTES
+1,101,P101,100,2,0,1,1,0,0,1,0,0,1
+1,102,P102,100,1,0,1,0,0,0,0,1,0,0
+1,ZZZ,COUNTY TOTALS,200,3,0,2,1,0,0,1,1,0,1
+'''
+
+def brute_force(weights):
+    "RETURN: maximum total weight over all assignments of rows to columns"
+    n = len(weights)
+    m = len(weights[0])
+    if n > m:
+        weights = [list(col) for col in zip(*weights)]
+        (n, m) = (m, n)
+    return max(sum(weights[i][j] for (i,j) in enumerate(cols))
+               for cols in permutations(range(m), n))
+
+class TestOptimalAssignment(unittest.TestCase):
+
+    def check(self, weights):
+        pairs = optimal_assignment(weights)
+        n = len(weights)
+        m = len(weights[0])
+        self.assertEqual(min(n, m), len(pairs))
+        self.assertEqual(len(pairs), len(set(i for (i,j) in pairs)))
+        self.assertEqual(len(pairs), len(set(j for (i,j) in pairs)))
+        self.assertAlmostEqual(brute_force(weights),
+                               sum(weights[i][j] for (i,j) in pairs))
+
+    def test_greedy_is_not_optimal(self):
+        # Greedy takes (0,0)=0.9 and is left with (1,1)=0.1; total 1.0
+        weights = [[0.9, 0.8],
+                   [0.7, 0.1]]
+        self.assertEqual([(0,1), (1,0)], sorted(optimal_assignment(weights)))
+
+    def test_random(self):
+        rnd = random.Random(4)
+        for (n, m) in [(1, 1), (3, 3), (2, 5), (5, 2), (6, 6), (4, 7)]:
+            for trial in range(5):
+                self.check([[rnd.random() for j in range(m)]
+                            for i in range(n)])
+
+    def test_empty(self):
+        self.assertEqual([], optimal_assignment([]))
+        self.assertEqual([], optimal_assignment([[], []]))
+
+
+class TestCandidatePairs(unittest.TestCase):
+
+    def test_best_pairs(self):
+        pairs = candidate_pairs(['SMITH', 'DOE', 'NOBODY'],
+                                ['JANE DOE', 'JOHN SMITH', 'BOB BROWN'],
+                                limit=1)
+        self.assertIn((0, 1), pairs)
+        self.assertIn((1, 0), pairs)
+        self.assertNotIn((0, 0), pairs)
+        self.assertNotIn((1, 1), pairs)
+
+
+class TestMapDb(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = lambda name: os.path.join(self.tmpdir.name, name)
+        for (name, content) in [('lvr.csv', LVR_CSV), ('sovc.csv', SOVC_CSV)]:
+            with open(self.path(name), 'w') as f:
+                f.write(content)
+        (self.lvrdb, self.sovcdb, self.mapdb) = (
+            self.path('LVR.db'), self.path('SOVC.db'), self.path('MAP.db'))
+        LvrDb(self.lvrdb).insert_from_csv(self.path('lvr.csv'))
+        SovcDb(self.sovcdb).insert_from_csv(self.path('sovc.csv'))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def calc(self, **kwargs):
+        "RETURN: (race_map, choice_map) rows after calc with KWARGS"
+        with MapDb(self.mapdb, new=True, **kwargs) as mdb:
+            mdb.get_lvr_luts(self.lvrdb)
+            mdb.get_sovc_luts(self.sovcdb)
+            mdb.calc()
+        return self.maps()
+
+    def recalc(self, incremental=False):
+        """RETURN: (race_map, choice_map) rows after calc from the LUTs
+(or LUT snapshots) MAP.db already has"""
+        with MapDb(self.mapdb) as mdb:
+            mdb.calc(incremental=incremental)
+        return self.maps()
+
+    def maps(self):
+        "RETURN: (race_map, choice_map) rows of MAP.db"
+        con = sqlite3.connect(self.mapdb)
+        races = con.execute('SELECT lvr_race_title, sovc_race_title, origin'
+                            ' FROM race_map ORDER BY lvr_race_title;').fetchall()
+        choices = con.execute('SELECT lvr_choice_title, sovc_choice_title,'
+                              ' origin FROM choice_map'
+                              ' ORDER BY lvr_choice_title;').fetchall()
+        con.close()
+        return races, choices
+
+    def test_unmatched_lvr_race(self):
+        (races, choices) = self.calc()
+        self.assertEqual([('COUNCIL', 'COUNCIL', 'calc'),
+                          ('MAYOR', 'MAYOR', 'calc'),
+                          ('SHERIFF', '<none>', 'calc')], races)
+        self.assertIn(('SMITH', 'JOHN SMITH', 'calc'), choices)
+        self.assertIn(('undervote', 'UNDER VOTES', 'calc'), choices)
+        self.assertIn(('KANE', None, 'calc'), choices)
+
+    def test_similarity_cache(self):
+        maps = self.calc()
+        con = sqlite3.connect(self.mapdb)
+        scores = con.execute('SELECT count(*) FROM similarity;').fetchone()[0]
+        con.close()
+        self.assertGreater(scores, 0)
+        # new MAP.db in place of old one keeps its scores; none recomputed
+        with mock.patch('vvote.mapping_db.similar') as similar:
+            self.assertEqual(maps, self.calc())
+        similar.assert_not_called()
+
+    def test_pruned_pairs(self):
+        maps = self.calc()
+        # score only candidate pairs (n-gram index) in every race
+        with mock.patch.object(MapDb, 'prune_above', 0), \
+             mock.patch('vvote.mapping_db.candidate_pairs',
+                        wraps=candidate_pairs) as pairs:
+            self.assertEqual(maps, self.calc())
+        self.assertTrue(pairs.called)
+
+    def test_process_pool(self):
+        maps = self.calc(jobs=1)
+        # 3 LVR races (choice jobs) over 2 processes
+        with mock.patch('vvote.mapping_db.ProcessPoolExecutor',
+                        wraps=ProcessPoolExecutor) as pool:
+            self.assertEqual(maps, self.calc(jobs=2))
+        self.assertTrue(pool.called)
+
+    def test_snapshot(self):
+        maps = self.calc()
+        # LUTs are loaded from snapshots in MAP.db (sources are gone)
+        os.remove(self.lvrdb)
+        os.remove(self.sovcdb)
+        with self.assertLogs(level='WARNING'):
+            self.assertEqual(maps, self.recalc())
+
+        # snapshot of changed LVR.db is not used
+        with open(self.path('lvr.csv'), 'a') as f:
+            f.write('4,102,BS-2,ROE,JONES,KANE\n')
+        LvrDb(self.lvrdb).insert_from_csv(self.path('lvr.csv'))
+        (races, choices) = self.recalc()
+        self.assertEqual(maps[0], races)
+        self.assertIn(('ROE', None, 'calc'), choices)
+
+    def test_incremental(self):
+        maps = self.calc()
+        self.assertEqual(maps, self.recalc(incremental=True))
+
+        # Confirmed (imported) choice mappings are kept by incremental calc
+        con = sqlite3.connect(self.mapdb)
+        sovc = dict((lvr, (sid, sti)) for (lvr, sid, sti) in con.execute(
+            'SELECT lvr_choice_title, sovc_choice_id, sovc_choice_title'
+            ' FROM choice_map;'))
+        with con:
+            for (lvr, other) in [('SMITH', 'DOE'), ('DOE', 'SMITH')]:
+                con.execute("UPDATE choice_map SET sovc_choice_id = ?,"
+                            " sovc_choice_title = ?, origin = 'import'"
+                            " WHERE lvr_choice_title = ?;",
+                            sovc[other] + (lvr,))
+        con.close()
+        (races, choices) = self.recalc(incremental=True)
+        self.assertEqual(maps[0], races)
+        self.assertIn(('SMITH', 'JANE DOE', 'import'), choices)
+        self.assertIn(('DOE', 'JOHN SMITH', 'import'), choices)
+        self.assertIn(('JONES', 'ANN JONES', 'calc'), choices)
+        # full calc recalculates them
+        self.assertEqual(maps, self.recalc())
+
+    def export(self, choice_title=None):
+        """Export maps to CSV.  Replace LVR title of first choice row with
+CHOICE_TITLE (makes row invalid).  RETURN: (racemap_csv, choicemap_csv)"""
+        (racemap, choicemap) = (self.path('RACEMAP.csv'),
+                                self.path('CHOICEMAP.csv'))
+        with MapDb(self.mapdb) as mdb:
+            mdb.export(racemap_csv=racemap, choicemap_csv=choicemap)
+        if choice_title != None:
+            with open(choicemap, newline='') as f:
+                rows = list(csv.reader(f))
+            rows[1][3] = choice_title
+            with open(choicemap, 'w', newline='') as f:
+                csv.writer(f).writerows(rows)
+        return racemap, choicemap
+
+    def test_load_maps_rollback(self):
+        maps = self.calc()
+        aliasdb = self.path('ALIAS.db')
+        # valid RACEMAP, invalid CHOICEMAP: neither is imported
+        with MapDb(self.mapdb, aliasdb=aliasdb) as mdb:
+            with self.assertLogs(level='ERROR'):
+                self.assertRaises(BadMap, mdb.load_maps,
+                                  *self.export(choice_title='NOBODY'))
+        self.assertEqual(maps, self.maps())
+        with AliasDb(aliasdb) as adb:
+            self.assertEqual(dict(), adb.aliases())
+
+        with MapDb(self.mapdb, aliasdb=aliasdb) as mdb:
+            mdb.load_maps(*self.export())
+        # unmapped SOVC title is '' after round trip through CSV
+        imported = lambda rows: [(lvr, sovc or None, origin)
+                                 for (lvr, sovc, origin) in rows]
+        self.assertEqual(([r[:2] + ('import',) for r in maps[0]],
+                          [c[:2] + ('import',) for c in maps[1]]),
+                         tuple(map(imported, self.maps())))
+        with AliasDb(aliasdb) as adb:
+            self.assertEqual('MAYOR', adb.lookup('race', 'MAYOR'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+# EXAMPLE:
+#   python -m unittest vvote/tests/test_reconcile.py
+import unittest
+import os.path
+import sqlite3
+import tempfile
+from array import array
+
+import vvote.sql as sql
+from vvote.lvr_db import LvrDb
+from vvote.reconcile import (reconcile, reconcile_row, summary,
+                             precinct_matrices, reconcile_precincts,
+                             compare_precincts)
+
+# Precinct 101: LVR has one more SMITH vote than SOVC
+LVR_CSV = '''\
+Cast Vote Record,Precinct,Ballot Style,MAYOR
+1,101,BS-1,SMITH
+2,101,BS-1,SMITH
+3,101,BS-1,DOE
+4,102,BS-2,DOE
+5,102,BS-2,undervote
+'''
+# SOVC race 1 (MAYOR): choice 1 SMITH, 2 DOE, 3 UNDER VOTES
+SOVC_VOTES = [('101', 1, 1), ('101', 2, 1), ('101', 3, 0),
+              ('102', 1, 0), ('102', 2, 1), ('102', 3, 1),
+              ('ZZZ', 1, 1), ('ZZZ', 2, 2), ('ZZZ', 3, 1)]
+
+class TestReconcile(unittest.TestCase):
+
+    def test_reconcile_row(self):
+        status = lambda lvr, sovc: reconcile_row('R', 'C', lvr, sovc)['status']
+        self.assertEqual('match',     status(3, 3))
+        self.assertEqual('mismatch',  status(3, 2))
+        self.assertEqual('lvr_only',  status(3, None))
+        self.assertEqual('sovc_only', status(None, 4))
+        self.assertEqual('match',     status(None, 0)) # missing counts as 0
+        self.assertEqual(-4, reconcile_row('R', 'C', None, 4)['delta'])
+
+    def test_reconcile(self):
+        rows = reconcile([('A', 'x', 3), ('A', 'y', 2), ('B', 'z', 5)],
+                         {('A', 'x'): 3, ('A', 'y'): 1, ('C', 'w'): 4})
+        self.assertEqual([('A', 'x', 'match'), ('A', 'y', 'mismatch'),
+                          ('B', 'z', 'lvr_only'), ('C', 'w', 'sovc_only')],
+                         [(r['race'], r['choice'], r['status']) for r in rows])
+        self.assertEqual(dict(match=1, mismatch=1, lvr_only=1, sovc_only=1),
+                         summary(rows))
+
+    def test_reconcile_precincts(self):
+        choices = [(1, 'MAYOR', 'SMITH'), (2, 'MAYOR', 'DOE')]
+        lvr = array('q', [2, 1,   0, 1,   5, 0])
+        sovc = array('q', [1, 1,   0, 1,   2, 4])
+        (ranking, details) = reconcile_precincts(['101', '102', '103'],
+                                                 choices, lvr, sovc)
+        self.assertEqual([('103', 1, 7, 2), ('101', 2, 1, 1), ('102', 3, 0, 0)],
+                         [(r['precinct'], r['rank'], r['abs_delta'],
+                           r['choices_differ']) for r in ranking])
+        self.assertEqual([('101', 'SMITH', 1), ('103', 'SMITH', 3),
+                          ('103', 'DOE', -4)],
+                         [(d['precinct'], d['choice'], d['delta'])
+                          for d in details])
+
+
+class TestComparePrecincts(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        path = lambda name: os.path.join(self.tmpdir.name, name)
+        (self.lvrdb, self.sovcdb, self.mapdb) = (
+            path('LVR.db'), path('SOVC.db'), path('MAP.db'))
+        with open(path('lvr.csv'), 'w') as f:
+            f.write(LVR_CSV)
+        LvrDb(self.lvrdb).insert_from_csv(path('lvr.csv'))
+
+        con = sqlite3.connect(self.sovcdb)
+        con.executescript(sql.sovc_schema)
+        con.execute("INSERT INTO race VALUES (1, 'MAYOR', 1);")
+        con.executemany('INSERT INTO choice VALUES (?,?,1,NULL);',
+                        [(1, 'SMITH'), (2, 'DOE'), (3, 'UNDER VOTES')])
+        con.executemany('INSERT INTO precinct VALUES (?,1,?,100,3,0);',
+                        [('101', 'P101'), ('102', 'P102'), ('ZZZ', 'TOTAL')])
+        con.executemany('INSERT INTO vote VALUES (?,?,?);', SOVC_VOTES)
+        con.commit()
+        con.close()
+
+        lvr = sqlite3.connect(self.lvrdb)
+        lvrChoice = dict([(title, cid) for (cid, title, rid)
+                          in lvr.execute(sql.lvr_choice)])
+        lvr.close()
+        con = sqlite3.connect(self.mapdb)
+        con.executescript(sql.map_schema)
+        con.executemany('INSERT INTO choice_map VALUES (1.0,1,?,?,?,?,?);',
+                        [(lvrChoice[lti], lti, sid, sti, 'calc')
+                         for (lti, sid, sti) in [('SMITH', 1, 'SMITH'),
+                                                 ('DOE', 2, 'DOE'),
+                                                 ('undervote', 3,
+                                                  'UNDER VOTES')]])
+        con.commit()
+        con.close()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_precinct_matrices(self):
+        (precincts, choices, lvr, sovc) = precinct_matrices(
+            self.lvrdb, self.sovcdb, self.mapdb)
+        self.assertEqual(['101', '102'], precincts)
+        self.assertEqual([(1, 'MAYOR', 'SMITH'), (2, 'MAYOR', 'DOE')],
+                         choices) # UNDER VOTES skipped
+        self.assertEqual([2, 1, 0, 1], list(lvr))
+        self.assertEqual([1, 1, 0, 1], list(sovc))
+
+    def test_compare_precincts(self):
+        csvfile = os.path.join(self.tmpdir.name, 'precincts.csv')
+        ranking = compare_precincts(self.lvrdb, self.sovcdb, self.mapdb,
+                                    csvfile=csvfile)
+        self.assertEqual([('101', 1), ('102', 0)],
+                         [(r['precinct'], r['abs_delta']) for r in ranking])
+        with open(csvfile) as f:
+            self.assertEqual(3, len(f.readlines()))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+# EXAMPLE:
+#   python -m unittest vvote/tests/test_sovc_db.py
+import unittest
+import csv
+import os.path
+import sqlite3
+import sys
+import tempfile
+from unittest import mock
+
+import vvote.sovc_db as sovc_db
+from vvote.sovc_db import SovcDb
+from vvote.sovc_sheet import SovcSheet
+from vvote.exceptions import BadSovc
+
+SOVC_CSV = '''\
+COUNTY NUMBER,PRECINCT CODE,PRECINCT NAME,REGISTERED VOTERS - TOTAL,BALLOTS CAST - TOTAL,BALLOTS CAST - BLANK,MAYOR,MAYOR,MAYOR,COUNCIL,COUNCIL
+,,,,,,DEM,REP,,,
+,,,VOTERS,BALLOTS CAST,BALLOTS CAST,JOHN SMITH,JANE DOE,UNDER VOTES,ANN JONES,BOB BROWN
+1,101,P101,100,2,0,1,1,0,1,0
+1,102,P102,90,1,1,0,0,1,0,1
+1,ZZZ,COUNTY TOTALS,190,3,1,1,1,1,1,1
+'''
+
+class TestSovcDb(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = lambda name: os.path.join(self.tmpdir.name, name)
+        self.csvfile = self.path('sovc.csv')
+        with open(self.csvfile, 'w') as f:
+            f.write(SOVC_CSV)
+        self.sovcdb = self.path('SOVC.db')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def read_csv(self, csvfile):
+        with open(csvfile, newline='') as f:
+            return list(csv.reader(f))
+
+    def test_count(self):
+        sheet = SovcSheet(self.csvfile, stream=True)
+        cells = {7: '12', 8: '12.0', 9: '-1', 10: '1.5', 11: 'x'}
+        self.assertEqual([12, 12, 0, 0, 0, 0],
+                         [sheet.count(4, c, cells) for c in range(7, 13)])
+        self.assertEqual([(4, 9, '-1', 'negative'),
+                          (4, 10, '1.5', 'not a whole number'),
+                          (4, 11, 'x', 'not a number'),
+                          (4, 12, None, 'blank')], sheet.errors)
+        with self.assertLogs(level='ERROR'):
+            self.assertRaises(BadSovc, sheet.check_errors)
+
+    def test_integer_counts(self):
+        SovcDb(self.sovcdb).insert_from_csv(self.csvfile)
+        con = sqlite3.connect(self.sovcdb)
+        self.assertEqual([('integer', 15)], con.execute(
+            'SELECT typeof(count), count(*) FROM vote'
+            ' GROUP BY typeof(count);').fetchall())
+        self.assertEqual((90, 1, 1), con.execute(
+            'SELECT registered_voters, ballots_cast_total, ballots_cast_blank'
+            " FROM precinct WHERE precinct_code = '102';").fetchone())
+        con.close()
+
+    def test_bad_count(self):
+        with open(self.csvfile, 'w') as f:
+            f.write(SOVC_CSV.replace('1,102,P102,90,1,1,0,0,1,0,1',
+                                     '1,102,P102,90,1,1,0,zero,1,0,1'))
+        with self.assertLogs(level='ERROR'):
+            self.assertRaises(BadSovc, SovcDb(self.sovcdb).insert_from_csv,
+                              self.csvfile)
+        # nothing of the SOVC is stored (schema only)
+        con = sqlite3.connect(self.sovcdb)
+        self.assertEqual([0, 0, 0, 0, 0], [
+            con.execute('SELECT count(*) FROM {};'.format(table)).fetchone()[0]
+            for table in ('source', 'race', 'choice', 'precinct', 'vote')])
+        con.close()
+
+    def test_to_csv(self):
+        outcsv = self.path('out.csv')
+        argv = ['sovcdb', '-d', self.sovcdb, '--incsv', self.csvfile,
+                '--outcsv', outcsv]
+        with mock.patch.object(sys, 'argv', argv):
+            sovc_db.main()
+        sovc = self.read_csv(self.csvfile)
+        out = self.read_csv(outcsv)
+        self.assertEqual(sovc[0], out[0])  # race titles
+        self.assertEqual(sovc[2][6:], out[2][6:]) # choice titles
+        self.assertEqual(sovc[3:], out[3:]) # one row per precinct
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+# EXAMPLE:
+#   python -m unittest vvote/tests/test_title_scan.py
+import unittest
+import os.path
+import sqlite3
+import tempfile
+
+from vvote.lvr_db import LvrDb
+from vvote.title_scan import write_lvr_titles
+
+# CVR 3 is a blank ballot; row 5 is empty.  Choice ids are in order of
+# first occurrence (JONES before BROWN).
+LVR_CSV = '''\
+Cast Vote Record,Precinct,Ballot Style,MAYOR,COUNCIL,
+1,101,BS-1,SMITH,JONES,
+2,101,BS-1,DOE,BROWN,JONES
+3,102,BS-2,,,
+,,,,,
+4,102,BS-2,SMITH,undervote,GREEN
+'''
+
+class TestTitleScan(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.csvfile = os.path.join(self.tmpdir.name, 'lvr.csv')
+        with open(self.csvfile, 'w') as f:
+            f.write(LVR_CSV)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def titles(self, dbfile):
+        "RETURN: (race rows, choice rows) of LVR DBFILE"
+        con = sqlite3.connect(dbfile)
+        races = con.execute('SELECT * FROM race ORDER BY race_id;').fetchall()
+        choices = con.execute('SELECT * FROM choice'
+                              ' ORDER BY choice_id;').fetchall()
+        con.close()
+        return races, choices
+
+    def test_same_ids_as_ingest(self):
+        lvrdb = os.path.join(self.tmpdir.name, 'LVR.db')
+        LvrDb(lvrdb).insert_from_csv(self.csvfile)
+        expected = self.titles(lvrdb)
+        for jobs in (1, 2):
+            titledb = os.path.join(self.tmpdir.name,
+                                   'LVR-titles-{}.db'.format(jobs))
+            self.assertEqual((2, 6), write_lvr_titles(self.csvfile, titledb,
+                                                      jobs=jobs))
+            self.assertEqual(expected, self.titles(titledb))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,190 @@
+#! /usr/bin/env python
+"""\
+Fast scan of LVR and SOVC files for Race and Choice titles only.
+
+Mapping needs only the distinct race titles (LVR header row, SOVC rows
+1-3) and the distinct choice titles of each LVR race column.  This scan
+collects them (without storing any votes) into small LVR and SOVC
+databases with the same race and choice ids full ingest will assign.
+MAP.db can then be built, exported and edited while the full ingest of
+LVR runs.
+
+The LVR CSV may be scanned in parallel over byte ranges of the file
+(--jobs).  Rows must not contain quoted newlines when doing so.
+
+EXAMPLES:
+  titlescan --lvr day1.lvr.csv --sovc export1.sovc.csv -m MAP.db
+"""
+
+import sys
+import argparse
+import csv
+import io
+import locale
+import logging
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+import vvote.sql as sql
+from vvote.lvr_sheet import LvrSheet
+from vvote.lvr_db import LvrDb
+from vvote.sovc_sheet import SovcSheet
+from vvote.sovc_db import SovcDb
+from vvote.mapping_db import MapDb
+
+
+def scan_choices(rows, header, minDataC, first, start=0):
+    """Record first position of each (raceTitle, choiceTitle) in ROWS.
+  rows :: iterable of (rowId, dict[columnId] => value) (as LvrSheet.rows)
+  header :: dict[columnId] => raceTitle
+  first :: dict[(raceTitle,choiceTitle)] => (start, rowId, columnId);
+           MODIFIED IN PLACE"""
+    for (rid,cells) in rows: # all rows; as LvrSheet.rows() (full ingest)
+        for (c,title) in cells.items():
+            if (c < minDataC) or (c not in header):
+                continue
+            key = (header.get(c), title)
+            if key not in first:
+                first[key] = (start, rid, c)
+    return first
+
+def scan_byte_range(filename, start, end, header, minDataC):
+    """Scan rows starting in byte range [START,END) of CSV FILENAME.
+START and END must be at the start of a line.
+RETURN: dict[(raceTitle,choiceTitle)] => (start, rowInRange, columnId)"""
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode(locale.getpreferredencoding(False))
+    rows = ((rid, LvrSheet.row_cells(row))
+            for (rid,row) in enumerate(csv.reader(io.StringIO(text, newline=''),
+                                                  dialect='excel')))
+    return scan_choices(rows, header, minDataC, dict(), start=start)
+
+def byte_ranges(filename, jobs):
+    """Split CSV FILENAME (after header line) into at most JOBS byte ranges
+that start at the start of a line.  RETURN: [(start, end), ...]"""
+    size = os.path.getsize(filename)
+    with open(filename, 'rb') as f:
+        f.readline() # header
+        bounds = [f.tell()]
+        for i in range(1, jobs):
+            f.seek(max(bounds[-1], bounds[0] + (size - bounds[0]) * i // jobs))
+            f.readline() # to start of next line
+            bounds.append(f.tell())
+    bounds.append(size)
+    return [(a,b) for (a,b) in zip(bounds, bounds[1:]) if a < b]
+
+def lvr_titles(lvrfile, jobs=1):
+    """Find distinct (race, choice) titles of LVRFILE (CSV or .xlsx).
+RETURN: (sheet, choices)
+  sheet :: LvrSheet with header row only (race titles, VoteFor)
+  choices :: [(raceTitle, choiceTitle), ...]; in order of first occurrence
+             (the order full ingest assigns choice ids)"""
+    sheet = LvrSheet(lvrfile, stream=True)
+    header = sheet.cells[1]
+    if (jobs <= 1) or lvrfile.lower().endswith('.xlsx'):
+        first = scan_choices(sheet.rows(), header, sheet.minDataC, dict())
+    else:
+        first = dict()
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [pool.submit(scan_byte_range, lvrfile, start, end,
+                                   header, sheet.minDataC)
+                       for (start,end) in byte_ranges(lvrfile, jobs)]
+            for future in futures: # in file order
+                for (key,pos) in future.result().items():
+                    if (key not in first) or (pos < first[key]):
+                        first[key] = pos
+    choices = sorted(first, key=first.get)
+    logging.info('Found {} races and {} choices in {}'
+                 .format(len(sheet.raceLut), len(choices), lvrfile))
+    return sheet, choices
+
+def write_lvr_titles(lvrfile, dbfile, jobs=1):
+    """Write race and choice tables of LVRFILE into (new) LVR DBFILE.
+Ids are the same as full ingest into a new DB would give.  No votes."""
+    sheet, choices = lvr_titles(lvrfile, jobs=jobs)
+    db = LvrDb(dbfile)
+    db.new_db()
+    con = db.conn
+    raceIds = dict() # raceIds[raceTitle] => raceId
+    for (rid,title) in enumerate(sorted(sheet.raceLut), 1):
+        raceIds[title] = rid
+        con.execute('INSERT INTO race VALUES (?,?,?)',
+                    (rid, sheet.voteFor[title], title))
+    con.executemany('INSERT INTO choice VALUES (?,?,?)',
+                    [(cid, choice, raceIds[race])
+                     for (cid,(race,choice)) in enumerate(choices, 1)])
+    con.commit()
+    con.close()
+    return len(raceIds), len(choices)
+
+def write_sovc_titles(sovcfile, dbfile):
+    """Write race and choice tables of SOVCFILE (from its header rows
+only) into (new) SOVC DBFILE.  No precincts or votes."""
+    sheet = SovcSheet(sovcfile, stream=True)
+    (race_list, choice_list) = sheet.get_race_lists()
+    db = SovcDb(dbfile)
+    db.new_db()
+    db.conn.execute('INSERT INTO source VALUES (?)', (sovcfile,))
+    db.insert_race_list(race_list)
+    db.insert_choice_list(choice_list)
+    db.close()
+    return len(race_list), len(choice_list)
+
+
+##############################################################################
+
+def main():
+    "Parse command line arguments and do the work."
+    parser = argparse.ArgumentParser(
+        description=('Collect Race and Choice titles of LVR and SOVC'
+                     ' (no votes) so MAP can be built before full ingest'),
+        epilog='EXAMPLE: %(prog)s --lvr day1.lvr.csv --sovc export.sovc.csv'
+        )
+    parser.add_argument('--version', action='version', version='1.0.1')
+    parser.add_argument('--lvr',
+                        help='LVR CSV (or .xlsx) file')
+    parser.add_argument('--sovc',
+                        help='SOVC CSV (or .xlsx) file')
+    parser.add_argument('--lvrdb', '-l', default='LVR-titles.db',
+                        help='LVR titles sqlite DB to write')
+    parser.add_argument('--sovcdb', '-s', default='SOVC-titles.db',
+                        help='SOVC titles sqlite DB to write')
+    parser.add_argument('--mapdb', '-m',
+                        help=('Create (new) MAP sqlite DB from titles and'
+                              ' export RACEMAP.csv, CHOICEMAP.csv'))
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help=('Number of processes scanning byte ranges of'
+                              ' LVR CSV (default: %(default)s)'))
+    parser.add_argument('--loglevel',
+                        help='Kind of diagnostic output',
+                        choices=['CRTICAL', 'ERROR', 'WARNING',
+                                 'INFO', 'DEBUG'],
+                        default='WARNING')
+    args = parser.parse_args()
+
+    log_level = getattr(logging, args.loglevel.upper(), None)
+    if not isinstance(log_level, int):
+        parser.error('Invalid log level: %s' % args.loglevel)
+    logging.basicConfig(level=log_level,
+                        format='%(levelname)s %(message)s',
+                        datefmt='%m-%d %H:%M')
+
+    if args.lvr:
+        print('LVR: {} races, {} choices written to {}'
+              .format(*write_lvr_titles(args.lvr, args.lvrdb, jobs=args.jobs),
+                      args.lvrdb))
+    if args.sovc:
+        print('SOVC: {} races, {} choices written to {}'
+              .format(*write_sovc_titles(args.sovc, args.sovcdb),
+                      args.sovcdb))
+    if args.mapdb:
+        with MapDb(args.mapdb, new=True) as mdb:
+            mdb.get_lvr_luts(args.lvrdb)
+            mdb.get_sovc_luts(args.sovcdb)
+            mdb.calc()
+            mdb.export()
+
+if __name__ == '__main__':
+    main()
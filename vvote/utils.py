@@ -1,4 +1,6 @@
 import csv
+import hashlib
+import os
 
 def read_lut(racemap):
     lut = dict() # dict[sovc_title] => lvr_title
@@ -14,3 +16,33 @@ def invert_lut(lut):
     for k,v in lut.items():
         assert v not in invlut
         invlut[v] = k
+
+def file_sha256(filename, blocksize=1 << 20):
+    "RETURN: hex SHA-256 digest of content of FILENAME"
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def file_fingerprint(filename):
+    """RETURN: "size:mtime_ns" of FILENAME (cheap change detection)
+or None if there is no such file."""
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return '{}:{}'.format(st.st_size, st.st_mtime_ns)
+
+def read_rows(filename):
+    """Generate rows (lists of text) of CSV or Excel (.xlsx) FILENAME.
+Excel rows are streamed from the worksheet and formatted as they would
+be in CSV written by xlsx2csv (so no CSV needs to be written to disk)."""
+    if filename.lower().endswith('.xlsx'):
+        from vvote.xlsx2csv import xlsx_rows # openpyxl only needed for xlsx
+        for row in xlsx_rows(filename):
+            yield ['' if value is None else str(value) for value in row]
+    else:
+        with open(filename, newline='') as csvfile:
+            for row in csv.reader(csvfile, dialect='excel'):
+                yield row
@@ -16,7 +16,16 @@ from openpyxl import Workbook
 import csv
 
 def xlsx2csv(xlsx_filename, csv_filename,
-             verbose=True, transpose=False, nrows=10000):
+             verbose=True, transpose=False, nrows=10000,
+             stream=False, maxcells=10000000):
+    """Write active worksheet of XLSX_FILENAME to CSV_FILENAME.
+If STREAM, read rows lazily (read-only workbook) and write each CSV row
+as it arrives.  Transpose then holds at most MAXCELLS values in memory
+(see xlsx2csv_stream)."""
+    if stream:
+        return xlsx2csv_stream(xlsx_filename, csv_filename,
+                               verbose=verbose, transpose=transpose,
+                               nrows=nrows, maxcells=maxcells)
     if verbose:
         print('# Output status every {} rows'.format(nrows))
     wb = load_workbook(filename=xlsx_filename)
@@ -49,6 +58,63 @@ def xlsx2csv(xlsx_filename, csv_filename,
             ridx += 1
             writer.writerow([cell.value for cell in row])
 
+def open_sized_worksheet(xlsx_filename):
+    """Open active worksheet of XLSX_FILENAME in read-only mode. 
+If the dimension stored in the file looks wrong, compute it (one pass).
+RETURN: (workbook, worksheet); caller must close workbook."""
+    wb = load_workbook(filename=xlsx_filename, read_only=True)
+    ws = wb.active
+    if ((ws.max_row in (None, 1)) or (ws.max_column in (None, 1))):
+        # unzip -p /data/mock-election/Final_Count_LVR.xlsx | grep dimension
+        ws.reset_dimensions()
+        ws.calculate_dimension(force=True)
+    return wb, ws
+
+def xlsx_rows(xlsx_filename):
+    """Generate rows (tuples of cell values) of active worksheet of 
+XLSX_FILENAME.  Rows are read lazily; memory does not depend on size."""
+    wb, ws = open_sized_worksheet(xlsx_filename)
+    try:
+        for row in ws.iter_rows(values_only=True):
+            yield row
+    finally:
+        wb.close()
+
+def xlsx2csv_stream(xlsx_filename, csv_filename,
+                    verbose=True, transpose=False, nrows=10000,
+                    maxcells=10000000):
+    """Streaming version of xlsx2csv.
+Transpose is done in passes over the sheet.  Each pass collects as many
+input columns as fit in MAXCELLS values and writes them as output rows."""
+    if verbose:
+        print('# Output status every {} rows'.format(nrows))
+    wb, ws = open_sized_worksheet(xlsx_filename)
+    max_row, max_col = ws.max_row, ws.max_column
+    print('# maxCol={}, maxRow={}'.format(max_col, max_row))
+    try:
+        with open(csv_filename, 'w', newline='') as csvfile:
+            writer = csv.writer(csvfile, dialect='unix')
+            if not transpose:
+                for ridx,row in enumerate(ws.iter_rows(values_only=True)):
+                    if verbose and ((ridx % nrows) == 0):
+                        print('# processed {} ballots'.format(ridx))
+                    writer.writerow(row)
+                return
+            chunk = max(1, maxcells // max(1, max_row))
+            for col1 in range(1, max_col + 1, chunk):
+                col2 = min(max_col, col1 + chunk - 1)
+                if verbose:
+                    print('# transposing columns {} to {}'.format(col1, col2))
+                # columns[i] = values of input column col1+i
+                columns = [list() for col in range(col1, col2 + 1)]
+                for row in ws.iter_rows(min_col=col1, max_col=col2,
+                                        values_only=True):
+                    for values,value in zip(columns, row):
+                        values.append(value)
+                writer.writerows(columns)
+    finally:
+        wb.close()
+
 
 ##############################################################################
 
@@ -67,6 +133,12 @@ def main():
     parser.add_argument('-t', '--transpose',
                         action='store_true',
                         help='Tranpose rows/columns on write to csvfile')
+    parser.add_argument('-s', '--stream',
+                        action='store_true',
+                        help=('Read rows lazily (read-only); bounded memory'
+                              ' even with --transpose'))
+    parser.add_argument('--maxcells', type=int, default=10000000,
+                        help='Cells held in memory per transpose pass')
     parser.add_argument('--loglevel',
                         help='Kind of diagnostic output',
                         choices=['CRTICAL', 'ERROR', 'WARNING',
@@ -88,7 +160,9 @@ def main():
     xlsx2csv(args.xlsxfile, args.csvfile,
              transpose=args.transpose,
              verbose=True,
-             nrows=10000)
+             nrows=10000,
+             stream=args.stream,
+             maxcells=args.maxcells)
 
 if __name__ == '__main__':
     main()